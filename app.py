@@ -3,11 +3,18 @@ from flask import Flask
 from flask_wtf.csrf import CSRFProtect
 import os
 import config
+import janitor
+import media
 import utils
+import video
+from commands import register_commands
 from routes.main import main_bp
 from routes.auth import auth_bp
 from routes.products import products_bp
 from routes.admin import admin_bp
+from routes.qr import qr_bp
+from routes.uploads import uploads_bp
+from routes.media import media_bp
 
 app = Flask(__name__)
 app.secret_key = config.SECRET_KEY
@@ -15,17 +22,33 @@ app.secret_key = config.SECRET_KEY
 # Bảo vệ CSRF
 csrf = CSRFProtect(app)
 
+# URL media, srcset ảnh thu nhỏ, nguồn phát video đã xử lý trong template
+app.add_template_global(media.media_url)
+app.add_template_global(media.image_sources)
+app.add_template_global(video.video_sources)
+
 # Đăng ký blueprints
 app.register_blueprint(main_bp)
 app.register_blueprint(auth_bp)
 app.register_blueprint(products_bp)
 app.register_blueprint(admin_bp)
+app.register_blueprint(qr_bp)
+app.register_blueprint(uploads_bp)
+app.register_blueprint(media_bp)
+
+# Lệnh CLI quản trị
+register_commands(app)
 
 # Khởi tạo thư mục và dữ liệu
 utils.init_directories()
-utils.load_data()
+utils.init_data()
 utils.load_users()
 
+# Thread xử lý video và thread dọn media khởi động ở request đầu tiên của mỗi worker
+# (không chạy trong các lệnh CLI, nơi tiến trình thoát giữa chừng sẽ bỏ dở job)
+app.before_request(video.start_workers)
+app.before_request(janitor.start)
+
 if __name__ == '__main__':
     # Chỉ chạy debug mode khi chạy local
     debug_mode = os.environ.get('FLASK_ENV') != 'production'
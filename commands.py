@@ -0,0 +1,200 @@
+"""Lệnh CLI quản trị (chạy bằng: flask --app app <lệnh>)"""
+import os
+import time
+import click
+import config
+import janitor
+import labels
+import media
+import qr
+import video
+import storage
+from storage import formats
+from storage.json_backend import JsonBackend
+
+
+def register_commands(app):
+    """Đăng ký các lệnh CLI cho ứng dụng"""
+
+    @app.cli.command('migrate-storage')
+    @click.option('--to', 'target_name', type=click.Choice(['sqlite', 'sharded']), default='sqlite',
+                  show_default=True, help='Backend đích')
+    @click.option('--force', is_flag=True, help='Ghi đè dữ liệu đã có ở backend đích')
+    def migrate_storage(target_name, force):
+        """Chuyển data.json/users.json sang backend khác (chạy một lần)"""
+        source = JsonBackend(config.DATA_FILE, config.USERS_FILE)
+        if not source.data_exists() or not source.users_exist():
+            raise click.ClickException('Không tìm thấy data.json hoặc users.json')
+
+        target = storage.create_backend(target_name)
+        if not force and target.data_exists() and target.count_products():
+            raise click.ClickException(f'Backend {target_name} đã có dữ liệu, dùng --force để ghi đè')
+
+        data = source.load_data()
+        users_data = source.load_users()
+        target.import_documents(data, users_data)
+        click.echo(f"Đã chuyển {len(data.get('products', []))} sản phẩm và "
+                   f"{len(users_data.get('users', []))} user sang backend {target_name}")
+        if config.STORAGE_BACKEND != target_name:
+            click.echo(f'Đặt STORAGE_BACKEND={target_name} để dùng dữ liệu mới')
+
+    @app.cli.command('convert-data')
+    @click.option('--to', 'fmt', type=click.Choice(formats.FORMATS),
+                  help='Ghi lại file dữ liệu theo định dạng này (bỏ trống: chỉ đo)')
+    @click.option('--repeat', default=5, show_default=True, help='Số lần đo thời gian đọc')
+    def convert_data(fmt, repeat):
+        """Đo kích thước/thời gian đọc dữ liệu thật theo từng định dạng và chuyển định dạng file"""
+        backend = storage.get_backend()
+        data_file = getattr(backend, 'data_file', None)
+        if data_file is None:
+            raise click.ClickException(f'Backend {backend.name} không lưu dữ liệu trong file JSON')
+        if not hasattr(data_file, 'convert'):
+            raise click.ClickException(f'Backend {backend.name} chỉ đọc được JSON, chạy lệnh với STORAGE_BACKEND=json')
+        if not backend.data_exists():
+            raise click.ClickException(f'Không tìm thấy {data_file.path}')
+
+        with open(data_file.path, 'rb') as f:
+            current = formats.detect(f.read(16))
+        if current == 'json':
+            current = 'json/json-indent'
+        data = data_file.load()
+        click.echo(f"{data_file.path}: {os.path.getsize(data_file.path)} bytes, định dạng {current}, "
+                   f"{len(data.get('products', []))} bản ghi")
+        click.echo(f"{'Định dạng':<12} {'Bytes':>12} {'Ghi (ms)':>10} {'Đọc (ms)':>10}")
+        for name in formats.available_formats():
+            start = time.perf_counter()
+            raw = formats.dumps(data, name)
+            dump_ms = (time.perf_counter() - start) * 1000
+            load_ms = min(_timed(formats.loads, raw) for _ in range(max(repeat, 1))) * 1000
+            click.echo(f'{name:<12} {len(raw):>12} {dump_ms:>10.2f} {load_ms:>10.2f}')
+        if 'msgpack' not in formats.available_formats():
+            click.echo('(msgpack chưa được cài, bỏ qua)')
+
+        if fmt:
+            before, after = data_file.convert(fmt)
+            click.echo(f'Đã ghi lại {data_file.path} theo định dạng {fmt}: {before} -> {after} bytes')
+            if config.DATA_FORMAT != fmt:
+                click.echo(f'Đặt DATA_FORMAT={fmt} để các lần ghi sau giữ định dạng này')
+
+    @app.cli.command('calibrate-bcrypt')
+    @click.option('--target-ms', default=250, show_default=True, help='Thời gian hash mục tiêu cho một lần đăng nhập')
+    @click.option('--max-rounds', default=16, show_default=True)
+    def calibrate_bcrypt(target_ms, max_rounds):
+        """Chọn số vòng bcrypt lớn nhất có thời gian hash không vượt mục tiêu trên máy này"""
+        import bcrypt
+        password = b'calibrate-bcrypt-password'
+        best = None
+        click.echo(f"{'Vòng':>5} {'ms':>10}")
+        for rounds in range(4, max_rounds + 1):
+            salt = bcrypt.gensalt(rounds)
+            elapsed = min(_timed(bcrypt.hashpw, password, salt) for _ in range(3 if rounds < 12 else 1)) * 1000
+            click.echo(f'{rounds:>5} {elapsed:>10.1f}')
+            if elapsed > target_ms:
+                break
+            best = rounds
+        if best is None:
+            raise click.ClickException(f'Không có số vòng nào dưới {target_ms} ms, tối thiểu là 4')
+        click.echo(f'Đặt BCRYPT_ROUNDS={best} (hiện tại {config.BCRYPT_ROUNDS}); '
+                   f'hash cũ được tạo lại khi user đăng nhập')
+
+    @app.cli.command('print-labels')
+    @click.option('--ids', help='Danh sách id sản phẩm, cách nhau bởi dấu phẩy')
+    @click.option('--owner', help='Chỉ in sản phẩm của người tạo này')
+    @click.option('--from', 'date_from', help='Ngày tạo từ (YYYY-MM-DD)')
+    @click.option('--to', 'date_to', help='Ngày tạo đến (YYYY-MM-DD)')
+    @click.option('--format', 'fmt', type=click.Choice(labels.FORMATS), default='pdf', show_default=True,
+                  help='pdf: một file nhiều trang; png: file ZIP mỗi trang một ảnh')
+    @click.option('--output', '-o', required=True, type=click.Path(dir_okay=False), help='File kết quả')
+    @click.option('--base-url', default=lambda: config.QR_BASE_URL, help='Địa chỉ trang web mã hóa trong QR')
+    @click.option('--workers', type=int, help='Số process vẽ (mặc định LABEL_WORKERS hoặc số CPU)')
+    @click.option('--level', type=click.Choice(qr.LEVELS), default='M', show_default=True, help='Mức sửa lỗi của QR')
+    def print_labels(ids, owner, date_from, date_to, fmt, output, base_url, workers, level):
+        """In tem QR hàng loạt cho sản phẩm đã chọn"""
+        if not base_url:
+            raise click.ClickException('Cần --base-url hoặc biến môi trường QR_BASE_URL')
+        products = labels.select_products(storage.get_backend(), ids=_split_ids(ids), owner=owner,
+                                          date_from=date_from, date_to=date_to)
+        if not products:
+            raise click.ClickException('Không có sản phẩm nào khớp điều kiện')
+
+        start = time.perf_counter()
+        size = 0
+        with open(output, 'wb') as f:
+            for chunk in labels.generate(products, base_url, fmt, workers=workers, level=level):
+                f.write(chunk)
+                size += len(chunk)
+        click.echo(f'Đã in {len(products)} tem vào {output} ({size} bytes, '
+                   f'{time.perf_counter() - start:.1f} giây)')
+
+    @app.cli.command('build-derivatives')
+    @click.option('--force', is_flag=True, help='Tạo lại cả ảnh đã có bản thu nhỏ')
+    def build_derivatives(force):
+        """Tạo ảnh thu nhỏ (srcset) cho các ảnh đã upload trước đây"""
+        built = skipped = 0
+        for directory, dirs, files in os.walk(config.UPLOAD_DIR):
+            if media.DERIVED_DIR in dirs:
+                dirs.remove(media.DERIVED_DIR)
+            for name in files:
+                if not media.is_image(name):
+                    continue
+                if not force and os.path.exists(os.path.join(directory, media.DERIVED_DIR, name + '.json')):
+                    skipped += 1
+                    continue
+                media.build_derivatives(os.path.join(directory, name))
+                built += 1
+        click.echo(f'Đã tạo ảnh thu nhỏ cho {built} ảnh, bỏ qua {skipped} ảnh đã có')
+
+    @app.cli.command('process-videos')
+    @click.option('--requeue', is_flag=True, help='Xếp hàng lại mọi video chưa xử lý xong (kể cả bị lỗi)')
+    @click.option('--once', is_flag=True, help='Xử lý hết hàng đợi rồi thoát')
+    def process_videos(requeue, once):
+        """Xử lý hàng đợi video (poster + bản MP4 cho web) trong tiến trình riêng"""
+        if not video.available():
+            raise click.ClickException(f'Không tìm thấy {config.FFMPEG_BIN}, hãy cài ffmpeg hoặc đặt FFMPEG_BIN')
+        if requeue:
+            queued = 0
+            for product in storage.get_backend().list_products():
+                product = storage.get_backend().get_product(product['id'])
+                statuses = product.get(storage.MEDIA_STATUS_FIELD) or {}
+                for media_path in product.get('production_media', []) + product.get('harvest_media', []):
+                    if (statuses.get(media_path) or {}).get('state') != 'ready' and \
+                            video.enqueue(product['id'], media_path):
+                        queued += 1
+            click.echo(f'Đã xếp hàng {queued} video')
+
+        video.requeue_stale_if_due()
+        done = 0
+        while True:
+            if video.run_once():
+                done += 1
+                continue
+            if once:
+                break
+            # Job của worker đã chết được xếp lại định kỳ, không chỉ lúc lệnh khởi động
+            video.requeue_stale_if_due()
+            time.sleep(video.POLL_INTERVAL)
+        click.echo(f'Đã xử lý {done} video, còn {video.pending_count()}')
+
+    @app.cli.command('gc-media')
+    @click.option('--dry-run', is_flag=True, help='Chỉ báo cáo, không xóa')
+    @click.option('--grace', type=int, help='Chỉ xóa file cũ hơn số giây này (mặc định JANITOR_GRACE)')
+    @click.option('--force', is_flag=True, help='Vẫn thu gom khi kho sản phẩm trống')
+    def gc_media(dry_run, grace, force):
+        """Dọn file media/QR không còn sản phẩm nào dùng trong static/"""
+        report = janitor.collect(dry_run=dry_run, grace=grace, force=force)
+        if 'skipped' in report:
+            raise click.ClickException(report['skipped'] + ', dùng --force nếu đúng là đã xóa hết sản phẩm')
+        action = 'Sẽ xóa' if dry_run else 'Đã xóa'
+        click.echo(f"{action} {report['files']} file/thư mục, {report['bytes']} bytes "
+                   f"(uploads {report['uploads']}, blobs {report['blobs']}, phái sinh {report['derived']}, "
+                   f"file tạm {report['temp']}, QR {report['qrcodes']}) trong {report['seconds']} giây")
+
+
+def _split_ids(ids):
+    return [i.strip() for i in (ids or '').split(',') if i.strip()]
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
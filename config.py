@@ -5,12 +5,99 @@ import os
 DATA_DIR = 'data'
 DATA_FILE = os.path.join(DATA_DIR, 'data.json')
 USERS_FILE = os.path.join(DATA_DIR, 'users.json')
-QRCODE_DIR = 'static/qrcodes'
+
+# Backend lưu trữ: 'json' (data.json/users.json), 'json-lazy' (cùng file, chỉ nạp
+# index danh sách, bản ghi đầy đủ đọc khi cần), 'sqlite' hoặc 'sharded'
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'json')
+SQLITE_FILE = os.environ.get('SQLITE_FILE', os.path.join(DATA_DIR, 'app.db'))
+PRODUCTS_DIR = os.path.join(DATA_DIR, 'products')  # Dùng cho backend 'sharded'
+# Định dạng ghi data.json (và manifest của 'sharded'): 'json-indent', 'json' (gọn),
+# 'marshal' hoặc 'msgpack' (cần cài msgpack). Khi đọc định dạng được tự nhận biết.
+DATA_FORMAT = os.environ.get('DATA_FORMAT', 'json-indent')
+
+# Nhật ký lượt quét QR, được gộp vào scan_count/last_scan theo chu kỳ (giây)
+SCAN_LOG_FILE = os.path.join(DATA_DIR, 'scans.log')
+SCAN_COMPACT_INTERVAL = int(os.environ.get('SCAN_COMPACT_INTERVAL', '10'))
+# Bộ đệm lượt quét trong bộ nhớ: xả sau mỗi N giây hoặc khi đủ N lượt
+SCAN_FLUSH_INTERVAL = int(os.environ.get('SCAN_FLUSH_INTERVAL', '5'))
+SCAN_FLUSH_THRESHOLD = int(os.environ.get('SCAN_FLUSH_THRESHOLD', '200'))
+QRCODE_DIR = 'static/qrcodes'  # QR dạng file của các sản phẩm cũ
+
+# Ảnh QR được vẽ khi có yêu cầu tại /qr/<id>.png. QR_BASE_URL là địa chỉ trang
+# web mã hóa trong QR (để trống: lấy theo request), đổi khi chuyển tên miền.
+QR_BASE_URL = os.environ.get('QR_BASE_URL', '')
+QR_CACHE_SIZE = int(os.environ.get('QR_CACHE_SIZE', '512'))  # Số ảnh giữ trong bộ nhớ mỗi worker
+QR_MAX_AGE = int(os.environ.get('QR_MAX_AGE', '86400'))  # Cache-Control max-age (giây)
+QR_SIZES = (128, 256, 512, 1024, 2048)  # Kích thước PNG cho phép chọn bằng ?size=
+
+# In tem QR hàng loạt (khổ A4): số cột/hàng mỗi trang, độ phân giải, font chú thích
+# (đường dẫn .ttf có dấu tiếng Việt, để trống: tự tìm DejaVuSans) và số process vẽ (0: số CPU)
+LABEL_COLUMNS = int(os.environ.get('LABEL_COLUMNS', '3'))
+LABEL_ROWS = int(os.environ.get('LABEL_ROWS', '4'))
+LABEL_DPI = int(os.environ.get('LABEL_DPI', '300'))
+LABEL_FONT = os.environ.get('LABEL_FONT', '')
+LABEL_WORKERS = int(os.environ.get('LABEL_WORKERS', '0'))
 UPLOAD_DIR = 'static/uploads'
+# Kho media theo nội dung (mỗi file lưu một lần theo SHA-256) và bảng đếm tham chiếu
+MEDIA_BLOB_DIR = os.path.join(UPLOAD_DIR, 'blobs')
+MEDIA_REFS_FILE = os.path.join(DATA_DIR, 'media_refs.json')
+# Dọn rác media ở nền: chu kỳ thu gom (giây, mặc định 0: tắt, ví dụ 21600 = 6 giờ), chỉ xóa
+# file cũ hơn JANITOR_GRACE giây (file vừa upload khi tạo sản phẩm có trước bản ghi); báo cáo
+# lần cuối lưu ở JANITOR_STATE_FILE
+JANITOR_GC_INTERVAL = int(os.environ.get('JANITOR_GC_INTERVAL', '0'))
+JANITOR_GRACE = int(os.environ.get('JANITOR_GRACE', '3600'))
+JANITOR_STATE_FILE = os.path.join(DATA_DIR, 'janitor.json')
+# Phục vụ media qua /media/<đường dẫn> (hỗ trợ Range). Blob đặt tên theo nội dung nên
+# được cache vĩnh viễn; media cũ dùng MEDIA_MAX_AGE giây. MEDIA_SENDFILE='x-accel' (nginx)
+# hoặc 'x-sendfile' (Apache/lighttpd) để proxy phía trước gửi file thay cho worker Python;
+# với x-accel, MEDIA_ACCEL_PREFIX là location internal của nginx trỏ tới static/uploads/
+MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', '86400'))
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '').lower()
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/_media/')
+
+# Session lưu ảnh chụp role/full_name của user; trang công khai sau số giây này mới
+# đối chiếu lại với kho user (0: mọi request). Trang cần đăng nhập và trang admin luôn đối chiếu
+USER_SNAPSHOT_TTL = int(os.environ.get('USER_SNAPSHOT_TTL', '30'))
+
+# Phân trang danh sách sản phẩm (trang chủ, admin, API)
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', '24'))
+MAX_PAGE_SIZE = 100
 
 # Cấu hình upload
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'avi', 'mkv', 'webm'}
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
+# Số file của một lần gửi form được ghi song song (thread pool dùng chung trong mỗi worker)
+UPLOAD_THREADS = int(os.environ.get('UPLOAD_THREADS', '4'))
+
+# Ảnh thu nhỏ WebP/JPEG cho trang sản phẩm (srcset): các chiều rộng (pixel), chất
+# lượng nén và số thread tạo ảnh nền trong mỗi worker
+IMAGE_WIDTHS = tuple(int(w) for w in os.environ.get('IMAGE_WIDTHS', '320,640,1280').split(','))
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', '80'))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '2'))
+
+# Xử lý video nền (cần ffmpeg): ảnh poster và bản MP4 H.264 phát được trên mọi trình
+# duyệt, giới hạn chiều cao và bitrate để file nhỏ. Hàng đợi là thư mục VIDEO_QUEUE_DIR dùng
+# chung giữa các worker; VIDEO_WORKERS là số thread xử lý trong mỗi worker gunicorn
+# (0: chỉ xử lý bằng lệnh flask --app app process-videos chạy riêng)
+FFMPEG_BIN = os.environ.get('FFMPEG_BIN', 'ffmpeg')
+VIDEO_QUEUE_DIR = os.path.join(DATA_DIR, 'video_jobs')
+VIDEO_WORKERS = int(os.environ.get('VIDEO_WORKERS', '1'))
+VIDEO_MAX_HEIGHT = int(os.environ.get('VIDEO_MAX_HEIGHT', '720'))
+VIDEO_MAX_BITRATE = int(os.environ.get('VIDEO_MAX_BITRATE', '1500'))  # kbit/s
+VIDEO_FFMPEG_THREADS = int(os.environ.get('VIDEO_FFMPEG_THREADS', '2'))
+VIDEO_JOB_TIMEOUT = int(os.environ.get('VIDEO_JOB_TIMEOUT', '3600'))  # Giây; job quá hạn bị coi là hỏng
+
+# Upload chia khúc, tiếp tục được khi mất mạng (/api/uploads): thư mục chứa các
+# phiên đang dở, kích thước tối đa mỗi khúc và thời gian giữ phiên bỏ dở (giây)
+UPLOAD_SESSIONS_DIR = os.path.join(DATA_DIR, 'upload_sessions')
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(5 * 1024 * 1024)))
+UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', '86400'))
+
+# Số vòng bcrypt (2^N lần lặp); chọn bằng: flask --app app calibrate-bcrypt
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+# Số phép hash bcrypt chạy cùng lúc trong mỗi worker (các lần đăng nhập khác xếp hàng);
+# tổng CPU dành cho bcrypt tối đa là WEB_CONCURRENCY × BCRYPT_THREADS lõi
+BCRYPT_THREADS = int(os.environ.get('BCRYPT_THREADS', '1'))
 
 # Secret key - Nên đặt trong biến môi trường cho production
 SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-key-change-in-production-0deab411eb2ed51a3a625a05ce9602c521d54ad4c3ceab1d3af2d35978b9ca15')
@@ -0,0 +1,11 @@
+"""Cấu hình gunicorn (tự động được đọc khi chạy từ thư mục gốc project)"""
+import os
+
+# Dữ liệu được ghi nguyên tử và có khóa liên tiến trình nên có thể chạy nhiều worker.
+# Mặc định ít worker: mỗi worker giữ cache dữ liệu, cache QR và các thread nền riêng,
+# và trong container cpu_count() là số CPU của máy chủ chứ không phải giới hạn container.
+# Tăng bằng WEB_CONCURRENCY theo số CPU/RAM thực được cấp.
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+# Mỗi worker nhiều thread (gthread): request khác vẫn được phục vụ trong lúc
+# một request đăng nhập chờ bcrypt (utils.run_bcrypt giới hạn số hash cùng lúc)
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
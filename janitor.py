@@ -0,0 +1,275 @@
+"""Dọn file media ở nền: xóa file của sản phẩm đã xóa và định kỳ dọn rác trong static/.
+
+Khi xóa sản phẩm, tham chiếu blob được giảm ngay trong request (nhanh, và
+không được mất: blob còn số đếm > 0 sẽ không bao giờ bị xóa). Chỉ việc xóa QR
+cũ và thư mục media riêng (có thể là shutil.rmtree một thư mục video lớn) được
+xếp vào hàng đợi trong bộ nhớ của thread janitor (mỗi tiến trình một thread);
+nếu tiến trình tắt trước khi xử lý, các file đó thành rác mồ côi cho
+janitor.collect / lệnh gc-media. Lỗi được ghi log thay vì bị bỏ qua.
+
+Thu gom rác (collect) đối chiếu static/uploads và static/qrcodes với kho sản
+phẩm: thư mục/file không còn sản phẩm nào dùng, ảnh phái sinh mất file gốc,
+file tạm bỏ dở và blob hết tham chiếu đều bị xóa. Chỉ xóa thứ cũ hơn
+JANITOR_GRACE giây vì file vừa upload khi tạo sản phẩm có trước bản ghi.
+Kho không có sản phẩm nào mà static/ vẫn còn media (ví dụ đổi STORAGE_BACKEND
+trước khi chạy migrate-storage) thì từ chối thu gom, trừ khi `force`.
+Thu gom định kỳ phải bật bằng JANITOR_GC_INTERVAL (mặc định tắt): thread
+janitor chạy mỗi chừng ấy giây, lần đầu sau một chu kỳ kể từ khi khởi động;
+JANITOR_STATE_FILE (có khóa file) đảm bảo mỗi chu kỳ chỉ một worker chạy và
+lưu báo cáo lần cuối.
+"""
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import config
+import media
+import media_store
+import storage
+from storage.json_file import FileLock, write_json
+
+_queue = queue.Queue()
+_lock = threading.Lock()
+_thread_pid = None
+
+# Chu kỳ thức dậy của thread janitor khi không có việc (giây)
+TICK = 60
+
+
+def _tree_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path, dry_run=False):
+    """Xóa file hoặc thư mục, trả về số byte giải phóng (0 nếu lỗi, có ghi log)"""
+    try:
+        size = _tree_size(path)
+        if not dry_run:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        print(f"Lỗi khi xóa {path}: {str(e)}")
+        return 0
+
+
+# ----- Xóa file của sản phẩm -----
+
+def release_product_media(product_id, product):
+    """Giảm tham chiếu các blob của sản phẩm đã xóa (blob hết tham chiếu bị xóa), trả về số byte"""
+    try:
+        return media_store.release(product.get('production_media', []) + product.get('harvest_media', []))
+    except Exception as e:
+        print(f"Lỗi khi giải phóng media của sản phẩm {product_id}: {str(e)}")
+        return 0
+
+
+def delete_product_files(product_id):
+    """Xóa QR cũ và thư mục media riêng của sản phẩm (chạy đồng bộ), trả về số byte"""
+    freed = _remove(os.path.join(config.QRCODE_DIR, f'{product_id}.png'))
+    for upload_type in ('production', 'harvest'):
+        freed += _remove(os.path.join(config.UPLOAD_DIR, upload_type, product_id))
+    return freed
+
+
+def submit_product_deletion(product_id, product=None):
+    """Giảm tham chiếu blob ngay, xếp việc xóa QR/thư mục media riêng vào hàng đợi janitor (không chờ)"""
+    if product:
+        release_product_media(product_id, product)
+    start()
+    _queue.put(product_id)
+
+
+# ----- Thu gom rác -----
+
+def _old(path, now, grace):
+    try:
+        return now - os.path.getmtime(path) >= grace
+    except OSError:
+        return False
+
+
+def _media_usage(backend):
+    """(tập id sản phẩm, {đường dẫn media: số lần được tham chiếu})"""
+    ids = set()
+    used = {}
+    for summary in backend.list_products():
+        product = backend.get_product(summary['id'])
+        if product is None:
+            continue
+        ids.add(product['id'])
+        for media_path in product.get('production_media', []) + product.get('harvest_media', []):
+            used[media_path] = used.get(media_path, 0) + 1
+    return ids, used
+
+
+def _collect_derived(directory, now, grace, dry_run):
+    """Xóa file phái sinh trong directory/_derived mà file gốc không còn"""
+    derived_dir = os.path.join(directory, media.DERIVED_DIR)
+    if not os.path.isdir(derived_dir):
+        return 0, 0
+    sources = set(os.listdir(directory))
+    files = freed = 0
+    for name in os.listdir(derived_dir):
+        path = os.path.join(derived_dir, name)
+        # Tên phái sinh là <tên file gốc>-<rộng>.<đuôi> hoặc <tên file gốc>.<hậu tố>
+        if any(name.startswith((source + '-', source + '.')) for source in sources if source != media.DERIVED_DIR):
+            continue
+        if _old(path, now, grace):
+            files += 1
+            freed += _remove(path, dry_run)
+    return files, freed
+
+
+def _has_media():
+    """static/ còn file media/QR nào không"""
+    for upload_type in ('production', 'harvest'):
+        type_dir = os.path.join(config.UPLOAD_DIR, upload_type)
+        if os.path.isdir(type_dir) and os.listdir(type_dir):
+            return True
+    if media_store.blob_names():
+        return True
+    return os.path.isdir(config.QRCODE_DIR) and any(n.endswith('.png') for n in os.listdir(config.QRCODE_DIR))
+
+
+def collect(dry_run=False, grace=None, force=False):
+    """Dọn rác trong static/uploads và static/qrcodes, trả về báo cáo (số file, byte giải phóng).
+
+    Kho rỗng mà vẫn còn media thì không xóa gì (trừ khi `force`), báo cáo có khóa 'skipped'.
+    """
+    grace = config.JANITOR_GRACE if grace is None else grace
+    started = time.monotonic()
+    now = time.time()
+    ids, used = _media_usage(storage.get_backend())
+    if not ids and not force and _has_media():
+        reason = (f'Kho sản phẩm ({config.STORAGE_BACKEND}) trống nhưng static/ vẫn còn media: '
+                  'bỏ qua thu gom (chưa chạy migrate-storage?)')
+        print(f"Janitor: {reason}")
+        return {'dry_run': dry_run, 'skipped': reason, 'finished_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+    report = {'dry_run': dry_run, 'files': 0, 'bytes': 0,
+              'uploads': 0, 'blobs': 0, 'qrcodes': 0, 'derived': 0, 'temp': 0}
+
+    def count(kind, files, freed):
+        report['files'] += files
+        report['bytes'] += freed
+        report[kind] += freed
+
+    # Thư mục media riêng của từng sản phẩm (cách lưu trước kho blob)
+    for upload_type in ('production', 'harvest'):
+        type_dir = os.path.join(config.UPLOAD_DIR, upload_type)
+        for product_id in (os.listdir(type_dir) if os.path.isdir(type_dir) else []):
+            product_dir = os.path.join(type_dir, product_id)
+            if product_id not in ids:
+                if _old(product_dir, now, grace):
+                    count('uploads', 1, _remove(product_dir, dry_run))
+                continue
+            for name in os.listdir(product_dir):
+                path = os.path.join(product_dir, name)
+                if name == media.DERIVED_DIR or f'uploads/{upload_type}/{product_id}/{name}' in used:
+                    continue
+                if _old(path, now, grace):
+                    count('uploads', 1, _remove(path, dry_run))
+            count('derived', *_collect_derived(product_dir, now, grace, dry_run))
+
+    # Blob hết tham chiếu, file tạm của upload bị ngắt, phái sinh mồ côi trong kho blob
+    removed, freed = media_store.reconcile(used, grace, dry_run)
+    count('blobs', removed, freed)
+    if os.path.isdir(config.MEDIA_BLOB_DIR):
+        for name in os.listdir(config.MEDIA_BLOB_DIR):
+            path = os.path.join(config.MEDIA_BLOB_DIR, name)
+            if os.path.isdir(path):
+                count('derived', *_collect_derived(path, now, grace, dry_run))
+            elif name.startswith('.upload-') and _old(path, now, grace):
+                count('temp', 1, _remove(path, dry_run))
+
+    # QR dạng file của sản phẩm đã xóa
+    if os.path.isdir(config.QRCODE_DIR):
+        for name in os.listdir(config.QRCODE_DIR):
+            path = os.path.join(config.QRCODE_DIR, name)
+            if os.path.splitext(name)[0] not in ids and _old(path, now, grace):
+                count('qrcodes', 1, _remove(path, dry_run))
+
+    report['seconds'] = round(time.monotonic() - started, 2)
+    report['finished_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    return report
+
+
+def last_report():
+    """Báo cáo của lần thu gom gần nhất (hoặc None)"""
+    try:
+        with open(config.JANITOR_STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def collect_if_due():
+    """Thu gom nếu đã quá JANITOR_GC_INTERVAL giây từ lần trước (của bất kỳ worker nào).
+
+    Chưa có JANITOR_STATE_FILE (lần đầu bật) thì chỉ tạo file, lần thu gom
+    đầu tiên diễn ra sau một chu kỳ.
+    """
+    if config.JANITOR_GC_INTERVAL <= 0:
+        return None
+    with FileLock(config.JANITOR_STATE_FILE + '.lock'):
+        try:
+            if time.time() - os.path.getmtime(config.JANITOR_STATE_FILE) < config.JANITOR_GC_INTERVAL:
+                return None
+        except OSError:
+            write_json(config.JANITOR_STATE_FILE, {})
+            return None
+        report = collect()
+        write_json(config.JANITOR_STATE_FILE, report)
+    if 'skipped' not in report:
+        print(f"Janitor: đã dọn {report['files']} file/thư mục, giải phóng {report['bytes']} bytes")
+    return report
+
+
+# ----- Thread janitor -----
+
+def _run():
+    next_collect = time.monotonic() + TICK
+    while True:
+        try:
+            product_id = _queue.get(timeout=max(next_collect - time.monotonic(), 0))
+        except queue.Empty:
+            product_id = None
+        if product_id is not None:
+            try:
+                delete_product_files(product_id)
+            except Exception as e:
+                print(f"Lỗi khi xóa file của sản phẩm {product_id}: {str(e)}")
+        # Theo hạn giờ chứ không chỉ khi hàng đợi rảnh: xóa liên tục không làm hoãn thu gom mãi
+        if time.monotonic() >= next_collect:
+            next_collect = time.monotonic() + TICK
+            try:
+                collect_if_due()
+            except Exception as e:
+                print(f"Lỗi khi thu gom rác media: {str(e)}")
+
+
+def start():
+    """Khởi động thread janitor (mỗi tiến trình một thread)"""
+    global _thread_pid
+    if _thread_pid == os.getpid():
+        return
+    with _lock:
+        if _thread_pid == os.getpid():
+            return
+        _thread_pid = os.getpid()
+        threading.Thread(target=_run, name='media-janitor', daemon=True).start()
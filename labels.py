@@ -0,0 +1,254 @@
+"""In hàng loạt tem QR: vẽ song song bằng process pool, xuất PDF nhiều trang hoặc ZIP ảnh PNG.
+
+Kết quả được sinh dần từng trang (generator trả về các khúc bytes) nên có thể
+ghi thẳng ra file hoặc trả về qua HTTP mà không giữ cả tài liệu trong bộ nhớ.
+"""
+import collections
+import io
+import multiprocessing
+import os
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import config
+import qr
+
+FORMATS = ('pdf', 'png')
+
+# Dưới số tem này vẽ ngay trong tiến trình, không đáng để tạo process pool
+POOL_THRESHOLD = 24
+
+_FONT_CANDIDATES = ('DejaVuSans.ttf', 'Arial.ttf', 'LiberationSans-Regular.ttf')
+
+
+def select_products(backend, ids=None, owner=None, date_from=None, date_to=None):
+    """Chọn sản phẩm cần in tem: theo danh sách id (giữ thứ tự), hoặc lọc theo người tạo/ngày tạo"""
+    if ids:
+        products = [backend.get_product(product_id) for product_id in ids]
+        products = [p for p in products if p is not None]
+    elif owner:
+        products = backend.list_products_by_owner(owner)
+    else:
+        products = backend.list_products()
+
+    if date_from or date_to:
+        def in_range(product):
+            day = (product.get('created_at') or '')[:10]
+            return (not date_from or day >= date_from) and (not date_to or day <= date_to)
+        products = [p for p in products if in_range(p)]
+    return products
+
+
+def _load_font(size):
+    from PIL import ImageFont
+    for name in ([config.LABEL_FONT] if config.LABEL_FONT else []) + list(_FONT_CANDIDATES):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow < 10.1: font mặc định chỉ có một cỡ
+        return ImageFont.load_default()
+
+
+def _fit_text(draw, text, font, width):
+    """Cắt bớt chữ (thêm '…') để vừa chiều rộng tem"""
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + '…', font=font) > width:
+        text = text[:-1]
+    return text + '…'
+
+
+def render_label(job):
+    """Vẽ một tem (QR + tên + id sản phẩm), trả về PNG (bytes).
+
+    Hàm ở cấp module để gửi được sang process con.
+    """
+    from PIL import Image, ImageDraw
+    url, name, product_id, width, height, level = job
+
+    caption_size = max(height // 14, 10)
+    qr_side = min(width, height - caption_size * 3)
+    code = qr.build(url, box_size=1, level=level)
+    modules = code.modules_count + code.border * 2
+    code.box_size = max(qr_side // modules, 1)
+    qr_img = code.make_image(fill_color="black", back_color="white").get_image().convert('L')
+
+    label = Image.new('L', (width, height), 255)
+    label.paste(qr_img, ((width - qr_img.width) // 2, 0))
+
+    draw = ImageDraw.Draw(label)
+    font = _load_font(caption_size)
+    small = _load_font(max(caption_size * 4 // 5, 8))
+    y = qr_img.height + caption_size // 4
+    for text, f in ((name, font), (f'ID: {product_id}', small)):
+        text = _fit_text(draw, text, f, width - caption_size)
+        draw.text(((width - draw.textlength(text, font=f)) / 2, y), text, fill=0, font=f)
+        y += caption_size + caption_size // 3
+
+    buf = io.BytesIO()
+    label.save(buf, format='PNG', optimize=False)
+    return buf.getvalue()
+
+
+def _render_all(jobs, workers):
+    """Vẽ các tem theo thứ tự; giữ tối đa vài tem mỗi process đang chờ để bộ nhớ có giới hạn"""
+    if len(jobs) < POOL_THRESHOLD or workers <= 1:
+        for job in jobs:
+            yield render_label(job)
+        return
+
+    # Không dùng fork: được gọi cả từ request trong worker gunicorn nhiều thread, process
+    # con fork ra có thể kẹt ở khóa đang bị thread khác giữ. forkserver/spawn khởi động sạch.
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method)) as pool:
+        pending = collections.deque()
+        jobs = iter(jobs)
+        for job in jobs:
+            pending.append(pool.submit(render_label, job))
+            if len(pending) >= workers * 4:
+                break
+        for job in jobs:
+            yield pending.popleft().result()
+            pending.append(pool.submit(render_label, job))
+        while pending:
+            yield pending.popleft().result()
+
+
+def _sheets(products, base_url, cols, rows, dpi, workers, level):
+    """Các trang tem (ảnh PIL khổ A4, thang xám)"""
+    from PIL import Image
+    page_w, page_h = round(210 / 25.4 * dpi), round(297 / 25.4 * dpi)
+    margin = round(dpi * 0.4)
+    cell_w, cell_h = (page_w - 2 * margin) // cols, (page_h - 2 * margin) // rows
+    pad = cell_w // 12
+    jobs = [(qr.product_url(p['id'], base_url), p.get('product_name', ''), p['id'],
+             cell_w - 2 * pad, cell_h - 2 * pad, level) for p in products]
+
+    per_page = cols * rows
+    sheet = None
+    for i, png in enumerate(_render_all(jobs, workers)):
+        slot = i % per_page
+        if slot == 0:
+            if sheet is not None:
+                yield sheet
+            sheet = Image.new('L', (page_w, page_h), 255)
+        with Image.open(io.BytesIO(png)) as label:
+            sheet.paste(label, (margin + (slot % cols) * cell_w + pad, margin + (slot // cols) * cell_h + pad))
+    if sheet is not None:
+        yield sheet
+
+
+class _PdfWriter:
+    """Ghi PDF tuần tự: mỗi trang là một ảnh thang xám nén Flate.
+
+    Đối tượng 1 (Catalog) và 2 (Pages) được ghi cuối cùng vì khi đó mới biết
+    danh sách trang; bảng xref cho phép đối tượng nằm ở bất kỳ vị trí nào.
+    """
+
+    def __init__(self, dpi):
+        self.dpi = dpi
+        self._offset = 0
+        self._xref = {}
+        self._pages = []
+        self._next = 3
+
+    def _emit(self, data):
+        self._offset += len(data)
+        return data
+
+    def _object(self, num, body, stream=None):
+        self._xref[num] = self._offset
+        data = f'{num} 0 obj\n'.encode('ascii') + body
+        if stream is not None:
+            data += b'\nstream\n' + stream + b'\nendstream'
+        return self._emit(data + b'\nendobj\n')
+
+    def _alloc(self):
+        num = self._next
+        self._next += 1
+        return num
+
+    def header(self):
+        return self._emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def page(self, image):
+        width_pt, height_pt = image.width * 72 / self.dpi, image.height * 72 / self.dpi
+        image_num, content_num, page_num = self._alloc(), self._alloc(), self._alloc()
+        pixels = zlib.compress(image.tobytes(), 6)
+        content = f'q {width_pt:.2f} 0 0 {height_pt:.2f} 0 0 cm /Im0 Do Q'.encode('ascii')
+        self._pages.append(page_num)
+        return b''.join([
+            self._object(image_num, (
+                f'<< /Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} '
+                f'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(pixels)} >>'
+            ).encode('ascii'), pixels),
+            self._object(content_num, f'<< /Length {len(content)} >>'.encode('ascii'), content),
+            self._object(page_num, (
+                f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt:.2f} {height_pt:.2f}] '
+                f'/Resources << /XObject << /Im0 {image_num} 0 R >> >> /Contents {content_num} 0 R >>'
+            ).encode('ascii')),
+        ])
+
+    def close(self):
+        kids = ' '.join(f'{num} 0 R' for num in self._pages)
+        data = self._object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>'.encode('ascii'))
+        data += self._object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        xref_offset = self._offset
+        lines = [f'xref\n0 {self._next}\n', '0000000000 65535 f \n']
+        lines += [f'{self._xref[num]:010d} 00000 n \n' for num in range(1, self._next)]
+        lines.append(f'trailer\n<< /Size {self._next} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n')
+        return data + self._emit(''.join(lines).encode('ascii'))
+
+
+class _ChunkSink:
+    """File chỉ-ghi gom các khúc bytes cho zipfile (không cần seek)"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def generate(products, base_url, fmt='pdf', cols=None, rows=None, dpi=None, workers=None, level='M'):
+    """Sinh tệp tem QR theo từng khúc bytes: PDF nhiều trang hoặc ZIP các trang PNG.
+
+    `level` là mức sửa lỗi của QR (xem qr.LEVELS); tem dán trên bao bì dễ
+    trầy xước nên mặc định là M.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Định dạng tem không hợp lệ: {fmt}')
+    cols = cols or config.LABEL_COLUMNS
+    rows = rows or config.LABEL_ROWS
+    dpi = dpi or config.LABEL_DPI
+    workers = workers or config.LABEL_WORKERS or os.cpu_count() or 1
+    sheets = _sheets(products, base_url, cols, rows, dpi, workers, level)
+
+    if fmt == 'pdf':
+        writer = _PdfWriter(dpi)
+        yield writer.header()
+        for sheet in sheets:
+            yield writer.page(sheet)
+        yield writer.close()
+        return
+
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for i, sheet in enumerate(sheets, 1):
+            with archive.open(f'labels-{i:03d}.png', 'w') as f:
+                sheet.save(f, format='PNG', dpi=(dpi, dpi))
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,193 @@
+"""Ảnh phái sinh cho media upload: bản WebP/JPEG thu nhỏ ở vài chiều rộng, tạo ở nền.
+
+Ảnh gốc chụp từ điện thoại thường vài MB; trang sản phẩm (mở khi quét QR,
+hay trên mạng di động) dùng `srcset` trỏ tới các bản thu nhỏ để trình duyệt
+tự chọn cỡ vừa màn hình. Bản thu nhỏ nằm trong _derived/ cạnh ảnh gốc; với kho
+media theo nội dung (media_store) đó là thư mục của blob:
+
+    static/uploads/blobs/<ab>/_derived/<sha256><đuôi>-<rộng>.webp|.jpg
+    static/uploads/blobs/<ab>/_derived/<sha256><đuôi>.json  (ghi cuối cùng: đã xong)
+
+Bản thu nhỏ dùng chung cho mọi sản phẩm tham chiếu cùng blob. Chúng bị xóa
+cùng blob khi hết tham chiếu (media_store.release/reconcile, qua janitor);
+bản thu nhỏ mồ côi do janitor.collect dọn. Media cũ
+(uploads/<loại>/<id sản phẩm>/...) có _derived/ trong thư mục của sản phẩm và
+bị xóa cùng thư mục đó. Khi chưa có file .json, trang dùng ảnh gốc.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import config
+from storage.json_file import atomic_write_stream, write_json
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')  # GIF có thể là ảnh động nên giữ nguyên
+DERIVED_DIR = '_derived'
+
+_pool = None
+_pool_pid = None
+_pending = set()
+_ready = {}
+_lock = threading.Lock()
+
+
+def is_image(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def static_path(relative_path):
+    """Đường dẫn trên đĩa của file media lưu dạng 'uploads/...' (tương đối với static/)"""
+    return os.path.join(os.path.dirname(config.UPLOAD_DIR), relative_path)
+
+
+def media_url(relative_path):
+    """URL phục vụ file media 'uploads/...' qua route /media (hỗ trợ Range, cache dài hạn)"""
+    from flask import url_for
+
+    prefix = 'uploads/'
+    if not relative_path.startswith(prefix):
+        return url_for('static', filename=relative_path)
+    return url_for('media.media_file', filename=relative_path[len(prefix):])
+
+
+def _derived(file_path, suffix):
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, DERIVED_DIR, name + suffix)
+
+
+def build_derivatives(file_path):
+    """Tạo các bản thu nhỏ của một ảnh (chạy đồng bộ), trả về nội dung file .json.
+
+    Chỉ tạo các chiều rộng nhỏ hơn ảnh gốc. Ảnh lỗi vẫn ghi .json (không có
+    chiều rộng nào) để không bị xếp hàng lại mãi.
+    """
+    from PIL import Image, ImageOps
+
+    os.makedirs(os.path.join(os.path.dirname(file_path), DERIVED_DIR), exist_ok=True)
+    manifest = {'widths': []}
+    try:
+        with Image.open(file_path) as original:
+            # Kích thước thật lấy trước draft() (draft thu nhỏ luôn .size), đổi chiều nếu EXIF xoay 90°
+            full_width, full_height = original.size
+            if original.getexif().get(0x0112) in (5, 6, 7, 8):
+                full_width, full_height = full_height, full_width
+            # Giải mã JPEG ở độ phân giải thấp hơn ngay từ đầu (nhanh hơn nhiều so với resize sau);
+            # cả hai chiều vẫn >= chiều rộng lớn nhất nên xoay theo EXIF không làm thiếu điểm ảnh
+            largest = max(config.IMAGE_WIDTHS)
+            original.draft('RGB', (largest, largest))
+            image = ImageOps.exif_transpose(original)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # Nền trong suốt của PNG thành nền trắng (JPEG không có kênh alpha)
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+            manifest['width'], manifest['height'] = full_width, full_height
+
+            for width in sorted(config.IMAGE_WIDTHS):
+                if width >= full_width:
+                    break
+                resized = image.resize((width, max(round(full_height * width / full_width), 1)), Image.LANCZOS)
+                atomic_write_stream(_derived(file_path, f'-{width}.webp'),
+                                    lambda f: resized.save(f, format='WEBP', quality=config.IMAGE_QUALITY, method=4))
+                atomic_write_stream(_derived(file_path, f'-{width}.jpg'),
+                                    lambda f: resized.save(f, format='JPEG', quality=config.IMAGE_QUALITY,
+                                                           optimize=True, progressive=True))
+                manifest['widths'].append(width)
+    except Exception as e:
+        print(f"Lỗi khi tạo ảnh thu nhỏ cho {file_path}: {str(e)}")
+        manifest['error'] = str(e)
+
+    write_json(_derived(file_path, '.json'), manifest)
+    return manifest
+
+
+def _run(file_path):
+    try:
+        build_derivatives(file_path)
+    finally:
+        with _lock:
+            _pending.discard(file_path)
+
+
+def submit(file_path):
+    """Xếp hàng tạo bản thu nhỏ cho ảnh vừa lưu (không chờ).
+
+    Bỏ qua file không phải ảnh và ảnh đã có bản thu nhỏ (cùng nội dung đã upload trước đó).
+    """
+    global _pool, _pool_pid
+    if not is_image(file_path) or os.path.exists(_derived(file_path, '.json')):
+        return False
+    with _lock:
+        if file_path in _pending:
+            return False
+        if _pool is None or _pool_pid != os.getpid():
+            # Thread không đi theo qua fork, mỗi worker tạo pool riêng
+            _pool = ThreadPoolExecutor(max_workers=config.IMAGE_WORKERS, thread_name_prefix='media')
+            _pool_pid = os.getpid()
+        _pending.add(file_path)
+    _pool.submit(_run, file_path)
+    return True
+
+
+def remove_derivatives(file_path, dry_run=False):
+    """Xóa các file phái sinh (ảnh thu nhỏ, poster, bản video web) của một file, trả về số byte"""
+    directory, name = os.path.split(file_path)
+    derived_dir = os.path.join(directory, DERIVED_DIR)
+    freed = 0
+    try:
+        names = os.listdir(derived_dir)
+    except OSError:
+        return 0
+    for derived in names:
+        if derived.startswith((name + '-', name + '.')):
+            path = os.path.join(derived_dir, derived)
+            try:
+                freed += os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+            except OSError:
+                pass
+    if dry_run:
+        return freed
+    with _lock:
+        _ready.clear()
+    return freed
+
+
+def image_sources(relative_path):
+    """Nguồn ảnh cho template: {'src', 'webp', 'jpeg'} (srcset rỗng khi chưa có bản thu nhỏ).
+
+    Ảnh chưa có bản thu nhỏ (upload cũ, worker khởi động lại giữa chừng) được
+    xếp hàng tạo ngay lúc này, lần xem sau sẽ có.
+    """
+    sources = _ready.get(relative_path)
+    if sources is not None:
+        return sources
+
+    original = media_url(relative_path)
+    sources = {'src': original, 'webp': '', 'jpeg': ''}
+    file_path = static_path(relative_path)
+    try:
+        with open(_derived(file_path, '.json'), 'r', encoding='utf-8') as f:
+            widths = json.load(f).get('widths', [])
+    except (OSError, ValueError):
+        if os.path.exists(file_path):
+            submit(file_path)
+        return sources
+
+    if widths:
+        directory, name = os.path.split(relative_path)
+        def url(width, ext):
+            return media_url(f'{directory}/{DERIVED_DIR}/{name}-{width}.{ext}')
+        sources['webp'] = ', '.join(f'{url(w, "webp")} {w}w' for w in widths)
+        sources['jpeg'] = ', '.join(f'{url(w, "jpg")} {w}w' for w in widths)
+        sources['src'] = url(widths[-1], 'jpg')
+
+    with _lock:
+        if len(_ready) >= 4096:
+            _ready.clear()
+        _ready[relative_path] = sources
+    return sources
@@ -0,0 +1,207 @@
+"""Kho media theo nội dung: mỗi file chỉ lưu một lần, đặt tên theo SHA-256, có đếm tham chiếu.
+
+Nông dân hay dùng lại cùng một ảnh ruộng cho nhiều sản phẩm. File upload
+được băm trong lúc ghi xuống đĩa rồi lưu tại
+
+    static/uploads/blobs/<2 ký tự đầu của hash>/<sha256><đuôi file>
+
+và sản phẩm tham chiếu bằng đường dẫn đó (chứa hash) trong
+production_media/harvest_media. MEDIA_REFS_FILE đếm số tham chiếu của mỗi
+blob; blob (kèm ảnh thu nhỏ/bản video trong _derived/) chỉ bị xóa khi không
+còn sản phẩm nào dùng. Tạo và xóa blob cùng nằm trong khóa file của
+MEDIA_REFS_FILE nên upload trùng nội dung không thể chen vào giữa lúc xóa.
+
+Media cũ (uploads/<loại>/<id sản phẩm>/...) vẫn thuộc riêng từng sản phẩm.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import config
+import media
+from storage.json_file import CachedJsonFile
+
+BLOCK_SIZE = 1024 * 1024
+
+_refs = None
+
+
+def _refs_file():
+    global _refs
+    if _refs is None:
+        _refs = CachedJsonFile(config.MEDIA_REFS_FILE)
+    return _refs
+
+
+def _load_refs():
+    refs_file = _refs_file()
+    if not os.path.exists(refs_file.path):
+        return {'refs': {}}
+    return refs_file.load()
+
+
+def is_blob(relative_path):
+    """Đường dẫn media (tương đối với static/) có nằm trong kho blob không"""
+    return relative_path.startswith('uploads/blobs/')
+
+
+def _blob_name(digest, filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return digest + ext
+
+
+def _relative(name):
+    return f'uploads/blobs/{name[:2]}/{name}'
+
+
+def _acquire(tmp_path, name):
+    """Đưa file tạm vào kho (nếu chưa có blob này) và tăng số tham chiếu; trả về đường dẫn tương đối"""
+    relative_path = _relative(name)
+    blob_path = media.static_path(relative_path)
+    refs_file = _refs_file()
+    with refs_file.lock:
+        data = _load_refs()
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+            # Làm mới mtime để dọn rác (janitor) không xóa blob vừa được dùng lại
+            os.utime(blob_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, blob_path)
+        data['refs'][name] = data['refs'].get(name, 0) + 1
+        refs_file.save(data)
+    return relative_path
+
+
+def store_stream(stream, filename, max_size=None):
+    """Ghi luồng `stream` vào kho, băm SHA-256 trong lúc ghi.
+
+    Giới hạn `max_size` được kiểm tra ngay khi đọc (không cần seek để đo trước):
+    vượt quá hoặc file rỗng thì dừng, xóa file tạm và báo ValueError.
+    Trả về (đường dẫn tương đối, số byte).
+    """
+    os.makedirs(config.MEDIA_BLOB_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(prefix='.upload-', suffix='.tmp', dir=config.MEDIA_BLOB_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for block in iter(lambda: stream.read(BLOCK_SIZE), b''):
+                size += len(block)
+                if max_size is not None and size > max_size:
+                    raise ValueError(f'File {filename} quá lớn (tối đa {max_size} bytes)')
+                digest.update(block)
+                f.write(block)
+        if size == 0:
+            raise ValueError(f'File {filename} rỗng')
+        return _acquire(tmp_path, _blob_name(digest.hexdigest(), filename)), size
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def store_file(path, digest, filename):
+    """Đưa file đã có sẵn trên đĩa (đã biết SHA-256) vào kho, trả về đường dẫn tương đối.
+
+    File được đổi tên vào kho (ví dụ file ghép xong của upload chia khúc); nếu
+    khác ổ đĩa thì chép sang file tạm trong kho trước.
+    """
+    os.makedirs(config.MEDIA_BLOB_DIR, exist_ok=True)
+    if os.stat(path).st_dev != os.stat(config.MEDIA_BLOB_DIR).st_dev:
+        fd, tmp_path = tempfile.mkstemp(prefix='.upload-', suffix='.tmp', dir=config.MEDIA_BLOB_DIR)
+        with os.fdopen(fd, 'wb') as f, open(path, 'rb') as src:
+            shutil.copyfileobj(src, f, BLOCK_SIZE)
+        os.remove(path)
+        path = tmp_path
+    return _acquire(path, _blob_name(digest, filename))
+
+
+def release(media_paths):
+    """Giảm tham chiếu của các blob trong `media_paths` (bỏ qua media cũ).
+
+    Blob hết tham chiếu bị xóa cùng các file phái sinh; trả về số byte đã giải phóng.
+    """
+    names = [os.path.basename(p) for p in media_paths if is_blob(p)]
+    if not names:
+        return 0
+    freed = 0
+    refs_file = _refs_file()
+    with refs_file.lock:
+        data = _load_refs()
+        for name in names:
+            count = data['refs'].get(name, 0) - 1
+            if count > 0:
+                data['refs'][name] = count
+                continue
+            data['refs'].pop(name, None)
+            blob_path = media.static_path(_relative(name))
+            try:
+                freed += os.path.getsize(blob_path)
+                os.remove(blob_path)
+            except OSError:
+                pass
+            freed += media.remove_derivatives(blob_path)
+        refs_file.save(data)
+    return freed
+
+
+def blob_names():
+    """Tên các blob đang có trên đĩa"""
+    try:
+        shards = os.listdir(config.MEDIA_BLOB_DIR)
+    except OSError:
+        return []
+    names = []
+    for shard in shards:
+        directory = os.path.join(config.MEDIA_BLOB_DIR, shard)
+        if not os.path.isdir(directory):
+            continue
+        names.extend(n for n in os.listdir(directory) if n != media.DERIVED_DIR)
+    return names
+
+
+def reconcile(used, grace, dry_run=False):
+    """Đặt lại bảng đếm theo số tham chiếu thực tế `used` ({đường dẫn blob: số lần dùng}).
+
+    Blob không còn sản phẩm nào dùng và cũ hơn `grace` giây bị xóa cùng file
+    phái sinh. Blob mới hơn thì giữ nguyên số đếm vì có thể đang được upload
+    cho sản phẩm chưa kịp lưu. Trả về (số blob đã xóa, số byte giải phóng).
+    """
+    used = {os.path.basename(p): count for p, count in used.items() if is_blob(p)}
+    now = time.time()
+    removed = freed = 0
+    refs_file = _refs_file()
+    with refs_file.lock:
+        data = _load_refs()
+        refs = {}
+        for name in set(blob_names()) | set(data['refs']):
+            blob_path = media.static_path(_relative(name))
+            try:
+                young = now - os.path.getmtime(blob_path) < grace
+            except OSError:
+                continue  # Có trong bảng đếm nhưng không còn file
+            if name in used:
+                refs[name] = max(used[name], data['refs'].get(name, 0)) if young else used[name]
+            elif young:
+                if name in data['refs']:
+                    refs[name] = data['refs'][name]
+            else:
+                removed += 1
+                freed += os.path.getsize(blob_path) + media.remove_derivatives(blob_path, dry_run)
+                if not dry_run:
+                    os.remove(blob_path)
+        if not dry_run and refs != data['refs']:
+            data['refs'] = refs
+            refs_file.save(data)
+    return removed, freed
+
+
+def ref_counts():
+    """Bản sao bảng đếm tham chiếu {tên blob: số tham chiếu}"""
+    with _refs_file().lock:
+        return dict(_load_refs()['refs'])
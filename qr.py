@@ -0,0 +1,97 @@
+"""Tạo mã QR sản phẩm theo yêu cầu (không lưu file), có cache LRU trong bộ nhớ"""
+import hashlib
+import io
+from functools import lru_cache
+import config
+
+# Tăng khi đổi cách vẽ QR để ETag cũ không còn khớp
+RENDER_VERSION = '2'
+
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# Mức sửa lỗi: L ~7%, M ~15%, Q ~25%, H ~30% mã bị che/bẩn vẫn quét được
+LEVELS = ('L', 'M', 'Q', 'H')
+
+BORDER = 4
+
+
+def product_url(product_id, base_url):
+    """URL trang sản phẩm được mã hóa trong QR"""
+    return f"{base_url.rstrip('/')}/product/{product_id}"
+
+
+def etag_for(url, fmt='png', size=None, level='L'):
+    """ETag mạnh của ảnh QR, tính từ dữ liệu đầu vào nên không cần vẽ ảnh"""
+    key = f'{RENDER_VERSION}|{fmt}|{size}|{level}|{url}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def build(url, box_size=10, level='L'):
+    """Đối tượng qrcode.QRCode đã mã hóa `url` với mức sửa lỗi `level`"""
+    import qrcode
+
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=getattr(qrcode.constants, f'ERROR_CORRECT_{level}'),
+        box_size=box_size,
+        border=BORDER,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr
+
+
+def _svg(qr):
+    """SVG một path duy nhất: mỗi đoạn ô đen liền nhau trên một hàng là một nét ngang dày 1 ô.
+
+    Dùng lệnh di chuyển tương đối để path ngắn nhất có thể.
+    """
+    matrix = qr.get_matrix()  # Đã gồm viền trắng BORDER ô
+    side = len(matrix)
+    parts = []
+    pen_x, pen_y = 0, 0.5
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < side:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < side and row[x]:
+                x += 1
+            if parts:
+                parts.append(f'm{start - pen_x} {y + 0.5 - pen_y:g}h{x - start}')
+            else:
+                parts.append(f'M{start} {y + 0.5:g}h{x - start}')
+            pen_x, pen_y = x, y + 0.5
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{side * 10}" height="{side * 10}" '
+        f'viewBox="0 0 {side} {side}" shape-rendering="crispEdges">'
+        f'<rect width="{side}" height="{side}" fill="#fff"/>'
+        f'<path stroke="#000" d="{"".join(parts)}"/></svg>'
+    ).encode('utf-8')
+
+
+@lru_cache(maxsize=config.QR_CACHE_SIZE)
+def render(url, fmt='png', size=None, level='L'):
+    """Vẽ QR cho `url`, trả về nội dung ảnh (bytes).
+
+    PNG: cạnh ảnh không vượt quá `size` pixel (mặc định mỗi ô 10 pixel).
+    SVG: co giãn tự do nên bỏ qua `size`.
+    """
+    qr = build(url, level=level)
+    if fmt == 'svg':
+        return _svg(qr)
+
+    if size:
+        qr.box_size = max(size // (qr.modules_count + 2 * BORDER), 1)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buf = io.BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def cache_stats():
+    """Thống kê cache QR của worker hiện tại"""
+    info = render.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}
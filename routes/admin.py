@@ -1,7 +1,12 @@
 """Routes cho chức năng admin"""
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, Response
+import config
 import utils
-import bcrypt
+import storage
+import labels
+import janitor
+import qr
+import video
 import os
 from datetime import datetime
 import json
@@ -15,8 +20,8 @@ def admin_required(f):
             flash('Vui lòng đăng nhập để truy cập trang này.', 'error')
             return redirect(url_for('auth.login'))
         
-        users = utils.load_users()
-        current_user = next((u for u in users['users'] if u['username'] == session['user']), None)
+        # Luôn đối chiếu với kho user: bị hạ quyền hoặc bị xóa thì mất quyền admin ngay
+        current_user = utils.get_user_info(session, verify=True)
         
         if not current_user or current_user.get('role') != 'admin':
             flash('Bạn không có quyền truy cập trang này.', 'error')
@@ -31,15 +36,15 @@ def admin_required(f):
 def dashboard():
     """Trang dashboard admin"""
     # Thống kê tổng quan
-    data = utils.load_data()
-    users = utils.load_users()
+    backend = storage.get_backend()
+    users = backend.list_users()
     
     stats = {
-        'total_products': len(data['products']),
-        'total_users': len(users['users']),
-        'admin_users': len([u for u in users['users'] if u.get('role') == 'admin']),
-        'regular_users': len([u for u in users['users'] if u.get('role') != 'admin']),
-        'recent_products': sorted(data['products'], key=lambda x: x.get('created_at', ''), reverse=True)[:5]
+        'total_products': backend.count_products(),
+        'total_users': len(users),
+        'admin_users': len([u for u in users if u.get('role') == 'admin']),
+        'regular_users': len([u for u in users if u.get('role') != 'admin']),
+        'recent_products': backend.recent_products(5)
     }
     
     return render_template('admin/dashboard.html', stats=stats)
@@ -48,8 +53,8 @@ def dashboard():
 @admin_required
 def manage_users():
     """Quản lý người dùng"""
-    users = utils.load_users()
-    return render_template('admin/users.html', users=users['users'])
+    users = storage.get_backend().list_users()
+    return render_template('admin/users.html', users=users)
 
 @admin_bp.route('/users/create', methods=['GET', 'POST'])
 @admin_required
@@ -65,15 +70,15 @@ def create_user():
             flash('Vui lòng điền đầy đủ thông tin.', 'error')
             return render_template('admin/create_user.html')
         
-        users = utils.load_users()
+        backend = storage.get_backend()
         
         # Kiểm tra username đã tồn tại
-        if any(u['username'] == username for u in users['users']):
+        if backend.get_user(username):
             flash('Tên đăng nhập đã tồn tại.', 'error')
             return render_template('admin/create_user.html')
         
         # Tạo user mới
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = utils.hash_password(password)
         new_user = {
             'username': username,
             'password': hashed_password,
@@ -82,8 +87,7 @@ def create_user():
             'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
         
-        users['users'].append(new_user)
-        utils.save_users(users)
+        backend.add_user(new_user)
         
         flash(f'Đã tạo người dùng {username} thành công.', 'success')
         return redirect(url_for('admin.manage_users'))
@@ -94,8 +98,8 @@ def create_user():
 @admin_required
 def edit_user(username):
     """Chỉnh sửa người dùng"""
-    users = utils.load_users()
-    user = next((u for u in users['users'] if u['username'] == username), None)
+    backend = storage.get_backend()
+    user = backend.get_user(username)
     
     if not user:
         flash('Không tìm thấy người dùng.', 'error')
@@ -116,9 +120,12 @@ def edit_user(username):
         
         # Cập nhật mật khẩu nếu có
         if new_password:
-            user['password'] = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            user['password'] = utils.hash_password(new_password)
+        utils.bump_user_version(user)
         
-        utils.save_users(users)
+        backend.update_user(user)
+        if username == session.get('user'):
+            utils.set_session_user(session, user)
         flash(f'Đã cập nhật thông tin người dùng {username}.', 'success')
         return redirect(url_for('admin.manage_users'))
     
@@ -132,9 +139,9 @@ def delete_user(username):
         flash('Không thể xóa tài khoản của chính mình.', 'error')
         return redirect(url_for('admin.manage_users'))
     
-    users = utils.load_users()
-    users['users'] = [u for u in users['users'] if u['username'] != username]
-    utils.save_users(users)
+    # Session của user này hết hiệu lực ở request kế tiếp: login_required/admin_required
+    # đối chiếu với kho user và xóa session khi không còn user
+    storage.get_backend().delete_user(username)
     
     flash(f'Đã xóa người dùng {username}.', 'success')
     return redirect(url_for('admin.manage_users'))
@@ -142,35 +149,53 @@ def delete_user(username):
 @admin_bp.route('/products')
 @admin_required
 def manage_products():
-    """Quản lý sản phẩm"""
-    data = utils.load_data()
-    return render_template('admin/products.html', products=data['products'])
+    """Quản lý sản phẩm (phân trang theo id, mới nhất trước)"""
+    backend = storage.get_backend()
+    before, limit = utils.get_page_args(request.args)
+    products, next_before = backend.page_products(before, limit)
+    return render_template('admin/products.html', products=products, total=backend.count_products(),
+                           next_before=next_before, limit=limit, is_first_page=before is None)
+
+@admin_bp.route('/labels')
+@admin_required
+def print_labels():
+    """Tải tem QR hàng loạt: ?ids=a,b hoặc ?owner=&date_from=&date_to=, format=pdf|png, level=L|M|Q|H"""
+    fmt = request.args.get('format', 'pdf')
+    if fmt not in labels.FORMATS:
+        fmt = 'pdf'
+    ids = [i.strip() for i in request.args.get('ids', '').split(',') if i.strip()]
+    products = labels.select_products(
+        storage.get_backend(),
+        ids=ids,
+        owner=request.args.get('owner', '').strip() or None,
+        date_from=request.args.get('date_from', '').strip() or None,
+        date_to=request.args.get('date_to', '').strip() or None
+    )
+    if not products:
+        flash('Không có sản phẩm nào khớp điều kiện in tem.', 'error')
+        return redirect(url_for('admin.manage_products'))
+
+    level = request.args.get('level', 'M').upper()
+    if level not in qr.LEVELS:
+        level = 'M'
+
+    base_url = config.QR_BASE_URL or request.url_root
+    filename = f"tem-qr-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{'pdf' if fmt == 'pdf' else 'zip'}"
+    return Response(
+        labels.generate(products, base_url, fmt, level=level),
+        mimetype='application/pdf' if fmt == 'pdf' else 'application/zip',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 @admin_bp.route('/products/<product_id>/delete', methods=['POST'])
 @admin_required
 def delete_product(product_id):
     """Xóa sản phẩm"""
-    data = utils.load_data()
-    
     # Tìm và xóa sản phẩm
-    product = next((p for p in data['products'] if p['id'] == product_id), None)
+    product = storage.get_backend().delete_product(product_id)
     if product:
-        # Xóa file QR code
-        qr_path = os.path.join('static/qrcodes', f'{product_id}.png')
-        if os.path.exists(qr_path):
-            os.remove(qr_path)
-        
-        # Xóa thư mục upload
-        upload_dirs = ['static/uploads/production', 'static/uploads/harvest']
-        for upload_dir in upload_dirs:
-            product_dir = os.path.join(upload_dir, product_id)
-            if os.path.exists(product_dir):
-                import shutil
-                shutil.rmtree(product_dir)
-        
-        # Xóa khỏi data
-        data['products'] = [p for p in data['products'] if p['id'] != product_id]
-        utils.save_data(data)
+        # Xóa file QR code và media (blob dùng chung chỉ bị xóa khi hết tham chiếu)
+        utils.delete_product_files(product_id, product)
         
         flash(f'Đã xóa sản phẩm {product.get("name", product_id)}.', 'success')
     else:
@@ -193,7 +218,18 @@ def system_info():
         'data_files': {
             'products': os.path.exists('data/data.json'),
             'users': os.path.exists('data/users.json')
-        }
+        },
+        'storage': storage.get_backend().stats()
     }
     
-    return render_template('admin/system.html', info=info)
\ No newline at end of file
+    return render_template('admin/system.html', info=info)
+
+@admin_bp.route('/api/cache-stats')
+@admin_required
+def cache_stats():
+    """Thống kê kho dữ liệu/cache của worker đang xử lý request"""
+    stats = storage.get_backend().stats()
+    stats['qr_cache'] = qr.cache_stats()
+    stats['video_queue'] = video.pending_count()
+    stats['janitor'] = janitor.last_report()
+    return jsonify(stats)
@@ -2,6 +2,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session
 from datetime import datetime
 import utils
+import storage
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -15,18 +16,23 @@ def login():
         if not username or not password:
             return render_template('login.html', error='Vui lòng điền đầy đủ thông tin!')
 
-        users_data = utils.load_users()
-
         # Tìm user
-        for user in users_data.get('users', []):
-            if user.get('username') == username and utils.verify_password(password, user.get('password', '')):
-                # Đăng nhập thành công
-                session['user'] = username
-                session['user_name'] = user.get('full_name', username)
-
-                # Chuyển đến trang được yêu cầu hoặc trang chủ
-                next_page = request.args.get('next')
-                return redirect(next_page) if next_page else redirect(url_for('main.index'))
+        user = storage.get_backend().get_user(username)
+        if user and utils.verify_password(password, user.get('password', '')):
+            # Nâng cấp hash MD5 cũ hoặc bcrypt có số vòng đã lỗi thời
+            if utils.needs_rehash(user.get('password', '')):
+                try:
+                    user['password'] = utils.hash_password(password)
+                    storage.get_backend().update_user(user)
+                except Exception as e:
+                    print(f"Lỗi khi cập nhật hash mật khẩu của {username}: {str(e)}")
+
+            # Đăng nhập thành công
+            utils.set_session_user(session, user)
+
+            # Chuyển đến trang được yêu cầu hoặc trang chủ
+            next_page = request.args.get('next')
+            return redirect(next_page) if next_page else redirect(url_for('main.index'))
 
         return render_template('login.html', error='Tên đăng nhập hoặc mật khẩu không đúng!')
 
@@ -51,12 +57,11 @@ def register():
         if len(password) < 6:
             return render_template('register.html', error='Mật khẩu phải có ít nhất 6 ký tự!')
 
-        users_data = utils.load_users()
+        backend = storage.get_backend()
 
         # Kiểm tra username đã tồn tại chưa
-        for user in users_data.get('users', []):
-            if user.get('username') == username:
-                return render_template('register.html', error='Tên đăng nhập đã tồn tại!')
+        if backend.get_user(username):
+            return render_template('register.html', error='Tên đăng nhập đã tồn tại!')
 
         # Lấy thông tin liên hệ
         phone = request.form.get('phone', '').strip()
@@ -74,14 +79,10 @@ def register():
             'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
 
-        if 'users' not in users_data:
-            users_data['users'] = []
-        users_data['users'].append(new_user)
-        utils.save_users(users_data)
+        backend.add_user(new_user)
 
         # Tự động đăng nhập sau khi đăng ký
-        session['user'] = username
-        session['user_name'] = full_name
+        utils.set_session_user(session, new_user)
 
         return redirect(url_for('main.index'))
 
@@ -98,16 +99,10 @@ def logout():
 def profile():
     """Trang thông tin cá nhân - xem và sửa"""
     current_username = session.get('user')
-    users_data = utils.load_users()
+    backend = storage.get_backend()
 
     # Tìm user hiện tại
-    current_user = None
-    user_index = -1
-    for i, user in enumerate(users_data.get('users', [])):
-        if user.get('username') == current_username:
-            current_user = user
-            user_index = i
-            break
+    current_user = backend.get_user(current_username)
 
     if not current_user:
         return redirect(url_for('main.index'))
@@ -137,13 +132,13 @@ def profile():
         current_user['email'] = email
         current_user['address'] = address
         current_user['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        # Cập nhật session
-        session['user_name'] = full_name
+        utils.bump_user_version(current_user)
 
         # Lưu lại
-        users_data['users'][user_index] = current_user
-        utils.save_users(users_data)
+        backend.update_user(current_user)
+
+        # Cập nhật session
+        utils.set_session_user(session, current_user)
 
         # Chuẩn bị user_info để render
         user_info = {
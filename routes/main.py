@@ -1,39 +1,44 @@
 """Routes chính - trang chủ"""
-from flask import Blueprint, render_template, request, session
+from flask import Blueprint, render_template, request, session, jsonify, url_for
 import utils
+import storage
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
 def index():
     """Trang chính - hiển thị danh sách sản phẩm"""
-    data = utils.load_data()
-    products = data.get('products', [])
-
-    # Xử lý tìm kiếm
+    # Tìm kiếm theo tên sản phẩm, tên người sản xuất, khu vực
+    # (không phân biệt dấu, khớp theo tiền tố từ)
     search_query = request.args.get('search', '').strip()
-    if search_query:
-        # Lọc sản phẩm theo từ khóa tìm kiếm
-        search_lower = search_query.lower()
-        filtered_products = []
-        for product in products:
-            # Tìm trong tên sản phẩm, tên người sản xuất, khu vực
-            product_name = product.get('product_name', '').lower()
-            farmer_name = product.get('farmer_name', '').lower()
-            production_area = product.get('production_area', '').lower()
-
-            if (search_lower in product_name or
-                search_lower in farmer_name or
-                search_lower in production_area):
-                filtered_products.append(product)
-
-        products = filtered_products
-
-    # Sắp xếp theo thời gian tạo mới nhất
-    products.sort(key=lambda x: x.get('id', 0), reverse=True)
+
+    # Phân trang theo id (mới nhất trước)
+    before, limit = utils.get_page_args(request.args)
+    products, next_before = storage.get_backend().page_products(before, limit, search_query or None)
 
     # Lấy thông tin user nếu đã đăng nhập
     user_info = utils.get_user_info(session)
 
-    return render_template('index.html', products=products, user=user_info, search_query=search_query)
+    return render_template('index.html', products=products, user=user_info, search_query=search_query,
+                           next_before=next_before, is_first_page=before is None)
+
+@main_bp.route('/api/products')
+def api_products():
+    """API danh sách sản phẩm (JSON) với phân trang keyset: ?before=<id>&limit=&search="""
+    search_query = request.args.get('search', '').strip()
+    before, limit = utils.get_page_args(request.args)
+    products, next_before = storage.get_backend().page_products(before, limit, search_query or None)
+
+    items = []
+    for product in products:
+        item = storage.listing_summary(product)
+        item['url'] = url_for('products.product', product_id=product['id'], _external=True)
+        items.append(item)
+
+    return jsonify({
+        'products': items,
+        'next_before': next_before,
+        'next_url': url_for('main.api_products', before=next_before, limit=limit,
+                            search=search_query or None) if next_before else None
+    })
 
@@ -0,0 +1,46 @@
+"""Route phục vụ file media đã upload (ảnh, video, ảnh thu nhỏ, bản video web)
+
+Khác handler /static của Flask: hỗ trợ đầy đủ Range/If-Range (tua video),
+header cache dài hạn và chế độ X-Accel-Redirect/X-Sendfile để nginx/Apache
+gửi file, worker gunicorn được trả về ngay thay vì bị giữ suốt lúc phát video.
+"""
+from flask import Blueprint, abort, make_response, send_file
+from urllib.parse import quote
+from werkzeug.security import safe_join
+import mimetypes
+import os
+import config
+import media_store
+
+media_bp = Blueprint('media', __name__)
+
+# Blob đặt tên theo SHA-256 nên nội dung tại một URL không bao giờ đổi
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+@media_bp.route('/media/<path:filename>')
+def media_file(filename):
+    """File trong static/uploads; file ẩn (file tạm đang ghi dở) không được phục vụ"""
+    path = safe_join(os.path.abspath(config.UPLOAD_DIR), filename)
+    if path is None or any(part.startswith('.') for part in filename.split('/')) or not os.path.isfile(path):
+        abort(404)
+
+    immutable = media_store.is_blob('uploads/' + filename)
+    max_age = IMMUTABLE_MAX_AGE if immutable else config.MEDIA_MAX_AGE
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    if config.MEDIA_SENDFILE in ('x-accel', 'x-sendfile'):
+        # Proxy tự xử lý Range, ETag/Last-Modified và gửi byte; chỉ trả header
+        response = make_response('')
+        if config.MEDIA_SENDFILE == 'x-accel':
+            response.headers['X-Accel-Redirect'] = config.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + quote(filename)
+        else:
+            response.headers['X-Sendfile'] = path
+        response.mimetype = mimetype
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        # conditional=True: trả 206 cho Range, 304 cho If-None-Match/If-Modified-Since
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=True, max_age=max_age)
+    if immutable:
+        response.cache_control.immutable = True
+    return response
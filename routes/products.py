@@ -2,7 +2,9 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify
 from datetime import datetime
 import time
+import media_store
 import utils
+import storage
 import ai_analysis
 import ai_enhanced
 
@@ -42,9 +44,6 @@ def create():
         harvest_files = request.files.getlist('harvest_files')
         harvest_media = utils.save_uploaded_files(harvest_files, product_id, 'harvest')
 
-        # Tạo mã QR
-        qr_path = utils.generate_qrcode(product_id, request.url_root)
-
         # Tạo đối tượng sản phẩm
         product = {
             'id': product_id,
@@ -59,17 +58,12 @@ def create():
             'storage_method': storage_method,
             'production_media': production_media,  # Danh sách file media quá trình sản xuất
             'harvest_media': harvest_media,  # Danh sách file media quá trình thu hoạch
-            'qr_code': f'qrcodes/{product_id}.png',
             'created_by': session.get('user_id'),  # Lưu username của người tạo
             'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
 
-        # Lưu vào data.json
-        data = utils.load_data()
-        if 'products' not in data:
-            data['products'] = []
-        data['products'].append(product)
-        utils.save_data(data)
+        # Lưu vào kho dữ liệu
+        storage.get_backend().add_product(product)
 
         # Chuyển đến trang chi tiết sản phẩm của người tạo
         return redirect(url_for('products.view_product', product_id=product_id))
@@ -83,12 +77,9 @@ def create():
 def manage():
     """Trang quản lý sản phẩm - chỉ hiển thị sản phẩm của user đăng nhập"""
     current_user = session.get('user_id')
-    data = utils.load_data()
-    products = data.get('products', [])
 
-    # Lọc chỉ sản phẩm của user hiện tại
-    my_products = [p for p in products if p.get('created_by') == current_user]
-    my_products.sort(key=lambda x: x.get('id', 0), reverse=True)
+    # Chỉ lấy sản phẩm của user hiện tại, mới nhất trước
+    my_products = storage.get_backend().list_products_by_owner(current_user)
 
     # Lấy thông tin user
     user_info = utils.get_user_info(session)
@@ -100,27 +91,16 @@ def manage():
 def delete_product(product_id):
     """Xóa sản phẩm (chỉ xóa được sản phẩm của mình)"""
     current_user = session.get('user_id')
-    data = utils.load_data()
-    products = data.get('products', [])
-
-    # Tìm và xóa sản phẩm
-    product_found = False
-    for i, p in enumerate(products):
-        if p.get('id') == product_id:
-            # Kiểm tra quyền sở hữu
-            if p.get('created_by') != current_user:
-                return redirect(url_for('products.manage'))
-            # Xóa sản phẩm
-            products.pop(i)
-            product_found = True
-            break
-
-    if product_found:
-        data['products'] = products
-        utils.save_data(data)
+    backend = storage.get_backend()
+
+    # Kiểm tra quyền sở hữu (không tồn tại cũng coi như không sở hữu)
+    if not backend.owns_product(current_user, product_id):
+        return redirect(url_for('products.manage'))
 
+    product = backend.delete_product(product_id)
+    if product:
         # Xóa file QR code và media
-        utils.delete_product_files(product_id)
+        utils.delete_product_files(product_id, product)
 
         return redirect(url_for('products.manage'))
 
@@ -131,27 +111,25 @@ def delete_product(product_id):
 def edit_product(product_id):
     """Sửa sản phẩm (chỉ sửa được sản phẩm của mình)"""
     current_user = session.get('user_id')
-    data = utils.load_data()
-    products = data.get('products', [])
-
-    # Tìm sản phẩm
-    product = None
-    product_index = -1
-    for i, p in enumerate(products):
-        if p.get('id') == product_id:
-            # Kiểm tra quyền sở hữu
-            if p.get('created_by') != current_user:
-                return redirect(url_for('products.manage'))
-            product = p
-            product_index = i
-            break
+    backend = storage.get_backend()
+    product = backend.get_product(product_id)
 
     if not product:
         return redirect(url_for('products.manage'))
 
+    # Kiểm tra quyền sở hữu
+    if product.get('created_by') != current_user:
+        return redirect(url_for('products.manage'))
+
     if request.method == 'POST':
+        # Kiểm tra dữ liệu trước khi sửa và lưu file upload
+        product_name = request.form.get('product_name', '').strip()
+        if not product_name:
+            user_info = utils.get_user_info(session)
+            return render_template('edit.html', product=product, error='Vui lòng điền tên sản phẩm!', user=user_info)
+
         # Cập nhật thông tin sản phẩm
-        product['product_name'] = request.form.get('product_name', '').strip()
+        product['product_name'] = product_name
         # farmer_name không đổi vì đã được set khi tạo
         product['plant_type'] = request.form.get('plant_type', 'seasonal').strip()  # seasonal hoặc perennial
         product['planting_date'] = request.form.get('planting_date', '').strip()
@@ -162,31 +140,18 @@ def edit_product(product_id):
         product['storage_method'] = request.form.get('storage_method', '').strip()
         product['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-        # Xử lý upload file mới cho quá trình sản xuất
-        production_files = request.files.getlist('production_files')
-        new_production_media = utils.save_uploaded_files(production_files, product_id, 'production')
-        if new_production_media:
-            if 'production_media' not in product:
-                product['production_media'] = []
-            product['production_media'].extend(new_production_media)
-
-        # Xử lý upload file mới cho quá trình thu hoạch
-        harvest_files = request.files.getlist('harvest_files')
-        new_harvest_media = utils.save_uploaded_files(harvest_files, product_id, 'harvest')
-        if new_harvest_media:
-            if 'harvest_media' not in product:
-                product['harvest_media'] = []
-            product['harvest_media'].extend(new_harvest_media)
+        # Lưu thông tin; danh sách media được giữ nguyên (update_product không ghi đè)
+        backend.update_product(product)
 
-        # Kiểm tra dữ liệu
-        if not product['product_name']:
-            user_info = utils.get_user_info(session)
-            return render_template('edit.html', product=product, error='Vui lòng điền tên sản phẩm!', user=user_info)
-
-        # Lưu lại
-        products[product_index] = product
-        data['products'] = products
-        utils.save_data(data)
+        # File mới được nối vào danh sách media trong khóa ghi của backend, nên
+        # không ghi đè media vừa thêm qua upload chia khúc trong lúc form được gửi
+        for upload_type in ('production', 'harvest'):
+            files = request.files.getlist(f'{upload_type}_files')
+            new_media = utils.save_uploaded_files(files, product_id, upload_type)
+            if new_media and not backend.append_media(product_id, f'{upload_type}_media', new_media,
+                                                      product['updated_at']):
+                # Sản phẩm vừa bị xóa: trả lại tham chiếu blob
+                media_store.release(new_media)
 
         return redirect(url_for('products.manage'))
 
@@ -197,46 +162,26 @@ def edit_product(product_id):
 @products_bp.route('/product/<product_id>')
 def product(product_id):
     """Trang chi tiết sản phẩm - hiển thị khi quét QR"""
-    data = utils.load_data()
-    products = data.get('products', [])
-
-    # Tìm sản phẩm theo ID
-    product = None
-    product_index = -1
-    for i, p in enumerate(products):
-        if p.get('id') == product_id:
-            product = p
-            product_index = i
-            break
+    backend = storage.get_backend()
+    product = backend.get_product(product_id)
 
     if not product:
         return render_template('product.html', error='Không tìm thấy sản phẩm!', product=None, farmer_contact=None)
 
-    # Tăng số lượt quét QR
-    if 'scan_count' not in product:
-        product['scan_count'] = 0
-    product['scan_count'] = product.get('scan_count', 0) + 1
-    product['last_scan'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-    # Lưu lại
-    products[product_index] = product
-    data['products'] = products
-    utils.save_data(data)
+    # Ghi nhận lượt quét QR vào bộ đệm, bộ đếm được cập nhật nền
+    storage.get_scan_buffer().add(product_id)
 
     # Lấy thông tin liên hệ của người sản xuất
     farmer_contact = None
     created_by = product.get('created_by')
-    if created_by:
-        users_data = utils.load_users()
-        for user in users_data.get('users', []):
-            if user.get('username') == created_by:
-                farmer_contact = {
-                    'full_name': user.get('full_name', ''),
-                    'phone': user.get('phone', ''),
-                    'email': user.get('email', ''),
-                    'address': user.get('address', '')
-                }
-                break
+    user = backend.get_user(created_by) if created_by else None
+    if user:
+        farmer_contact = {
+            'full_name': user.get('full_name', ''),
+            'phone': user.get('phone', ''),
+            'email': user.get('email', ''),
+            'address': user.get('address', '')
+        }
 
     return render_template('product.html', product=product, error=None, farmer_contact=farmer_contact)
 
@@ -245,15 +190,7 @@ def product(product_id):
 def view_product(product_id):
     """Trang chi tiết sản phẩm cho người tạo - có nút sửa/xóa"""
     current_user = session.get('user_id')
-    data = utils.load_data()
-    products = data.get('products', [])
-
-    # Tìm sản phẩm theo ID
-    product = None
-    for p in products:
-        if p.get('id') == product_id:
-            product = p
-            break
+    product = storage.get_backend().get_product(product_id)
 
     if not product:
         return render_template('view_product.html', error='Không tìm thấy sản phẩm!', product=None)
@@ -272,15 +209,7 @@ def view_product(product_id):
 def ai_report(product_id):
     """Trang báo cáo AI phân tích sản phẩm - phân tích mùa vụ, đánh giá tiêu chuẩn, gợi ý thị trường"""
     current_user = session.get('user_id')
-    data = utils.load_data()
-    products = data.get('products', [])
-
-    # Tìm sản phẩm theo ID
-    product = None
-    for p in products:
-        if p.get('id') == product_id:
-            product = p
-            break
+    product = storage.get_backend().get_product(product_id)
 
     if not product:
         return redirect(url_for('products.manage'))
@@ -302,16 +231,15 @@ def ai_report(product_id):
 @utils.login_required
 def ai_analysis_enhanced(product_id):
     """Trang phân tích AI nâng cao với OpenAI"""
-    data = utils.load_data()
-    product = next((p for p in data.get('products', []) if p['id'] == product_id), None)
+    backend = storage.get_backend()
+    product = backend.get_product(product_id)
     
     if not product:
         return redirect(url_for('main.index'))
     
     # Kiểm tra quyền truy cập (chỉ người tạo hoặc admin)
     current_user = session.get('user')
-    users_data = utils.load_users()
-    user_info = next((u for u in users_data['users'] if u['username'] == current_user), None)
+    user_info = backend.get_user(current_user) or {}
     
     if (product.get('farmer_name') != session.get('user_name') and 
         user_info.get('role') != 'admin'):
@@ -343,16 +271,15 @@ def ai_analysis_enhanced(product_id):
 @utils.login_required
 def api_ai_suggestions(product_id):
     """API endpoint để lấy gợi ý AI theo thời gian thực"""
-    data = utils.load_data()
-    product = next((p for p in data.get('products', []) if p['id'] == product_id), None)
+    backend = storage.get_backend()
+    product = backend.get_product(product_id)
     
     if not product:
         return jsonify({'error': 'Không tìm thấy sản phẩm'}), 404
     
     # Kiểm tra quyền truy cập
     current_user = session.get('user')
-    users_data = utils.load_users()
-    user_info = next((u for u in users_data['users'] if u['username'] == current_user), None)
+    user_info = backend.get_user(current_user) or {}
     
     if (product.get('farmer_name') != session.get('user_name') and 
         user_info.get('role') != 'admin'):
@@ -0,0 +1,51 @@
+"""Routes phục vụ ảnh mã QR sản phẩm"""
+from flask import Blueprint, request, abort, make_response
+import config
+import qr
+import storage
+
+qr_bp = Blueprint('qr', __name__)
+
+@qr_bp.route('/qr/<product_id>')
+@qr_bp.route('/qr/<product_id>.<any(png, svg):fmt>')
+def qr_image(product_id, fmt=None):
+    """Ảnh QR của sản phẩm, vẽ khi được yêu cầu lần đầu rồi giữ trong cache LRU.
+
+    Định dạng lấy theo đuôi .png/.svg, không có đuôi thì theo header Accept.
+    Tham số: ?size=<pixel> (một trong QR_SIZES, chỉ cho PNG) và
+    ?level=L|M|Q|H (mức sửa lỗi). URL mã hóa trong QR dùng QR_BASE_URL nếu
+    có, nên khi đổi tên miền chỉ cần đổi biến môi trường.
+    """
+    negotiated = fmt is None
+    if negotiated:
+        mimetype = request.accept_mimetypes.best_match(list(qr.FORMATS.values()), default=qr.FORMATS['png'])
+        fmt = 'svg' if mimetype == qr.FORMATS['svg'] else 'png'
+
+    size = request.args.get('size', type=int)
+    if fmt != 'png' or size not in config.QR_SIZES:
+        size = None
+    level = request.args.get('level', 'L').upper()
+    if level not in qr.LEVELS:
+        level = 'L'
+
+    # Kiểm tra trước cả nhánh 304 để id đã xóa/không tồn tại không nhận 304 có thể cache
+    # (chỉ tra index, không đọc bản ghi)
+    if not storage.get_backend().product_exists(product_id):
+        abort(404)
+
+    url = qr.product_url(product_id, config.QR_BASE_URL or request.url_root)
+    etag = qr.etag_for(url, fmt, size, level)
+
+    # Trình duyệt/CDN đã có đúng ảnh này: trả 304 mà không cần vẽ
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(qr.render(url, fmt, size, level))
+        response.mimetype = qr.FORMATS[fmt]
+
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = config.QR_MAX_AGE
+    if negotiated:
+        response.vary.add('Accept')
+    return response
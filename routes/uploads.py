@@ -0,0 +1,99 @@
+"""API upload chia khúc cho media sản xuất/thu hoạch (xem uploads.py)
+
+Máy khách gửi header X-CSRFToken cùng mỗi request (trừ GET).
+"""
+from flask import Blueprint, request, session, jsonify
+from datetime import datetime
+import media_store
+import storage
+import uploads
+import utils
+
+uploads_bp = Blueprint('uploads', __name__, url_prefix='/api/uploads')
+
+def _error(e):
+    return jsonify({'error': str(e)}), e.status
+
+def _owned_session(upload_id):
+    """Thông tin phiên upload nếu thuộc người đang đăng nhập"""
+    meta = uploads.get_meta(upload_id)
+    if meta.get('owner') != session.get('user'):
+        raise uploads.UploadError('Không có quyền truy cập', 403)
+    return meta
+
+@uploads_bp.route('', methods=['POST'])
+@utils.login_required
+def create_upload():
+    """Mở phiên upload: JSON {product_id, upload_type, filename, size, sha256?}"""
+    body = request.get_json(silent=True) or {}
+    product_id = str(body.get('product_id', ''))
+    product = storage.get_backend().get_product(product_id)
+    if not product:
+        return jsonify({'error': 'Không tìm thấy sản phẩm'}), 404
+
+    # Kiểm tra quyền sở hữu (giống trang sửa sản phẩm)
+    if product.get('created_by') != session.get('user_id'):
+        return jsonify({'error': 'Không có quyền truy cập'}), 403
+
+    try:
+        state = uploads.create_session(product_id, body.get('upload_type'), body.get('filename'),
+                                       body.get('size'), session.get('user'), body.get('sha256'))
+    except uploads.UploadError as e:
+        return _error(e)
+    return jsonify(state), 201
+
+@uploads_bp.route('/<upload_id>', methods=['GET'])
+@utils.login_required
+def upload_status(upload_id):
+    """Trạng thái phiên: offset là vị trí gửi khúc kế tiếp"""
+    try:
+        _owned_session(upload_id)
+        return jsonify(uploads.status(upload_id))
+    except uploads.UploadError as e:
+        return _error(e)
+
+@uploads_bp.route('/<upload_id>', methods=['PUT'])
+@utils.login_required
+def upload_chunk(upload_id):
+    """Nhận một khúc: ?offset=<byte bắt đầu>, thân request là dữ liệu nhị phân"""
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Thiếu tham số offset'}), 400
+    try:
+        _owned_session(upload_id)
+        # Đọc thẳng từ luồng request, không nạp cả khúc vào bộ nhớ
+        state = uploads.write_chunk(upload_id, offset, request.stream, request.content_length)
+    except uploads.UploadError as e:
+        return _error(e)
+    return jsonify(state)
+
+@uploads_bp.route('/<upload_id>/complete', methods=['POST'])
+@utils.login_required
+def complete_upload(upload_id):
+    """Ghép file, kiểm tra checksum và gắn vào danh sách media của sản phẩm"""
+    try:
+        _owned_session(upload_id)
+        meta, media_path = uploads.complete(upload_id)
+    except uploads.UploadError as e:
+        return _error(e)
+
+    # Nối trong khóa ghi của backend: không mất khi đang có người lưu form sửa sản phẩm
+    updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if not storage.get_backend().append_media(meta['product_id'], f"{meta['upload_type']}_media",
+                                              [media_path], updated_at):
+        # Sản phẩm đã bị xóa trong lúc upload: trả lại tham chiếu blob
+        media_store.release([media_path])
+        return jsonify({'error': 'Không tìm thấy sản phẩm'}), 404
+
+    return jsonify({'path': media_path, 'sha256': meta['sha256'], 'size': meta['size']})
+
+@uploads_bp.route('/<upload_id>', methods=['DELETE'])
+@utils.login_required
+def abort_upload(upload_id):
+    """Hủy phiên upload"""
+    try:
+        _owned_session(upload_id)
+        uploads.abort(upload_id)
+    except uploads.UploadError as e:
+        return _error(e)
+    return '', 204
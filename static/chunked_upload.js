@@ -0,0 +1,107 @@
+// Upload chia khúc, tiếp tục được khi mạng chập chờn (API /api/uploads).
+// Phiên đang dở được nhớ trong localStorage theo tên/kích thước/ngày sửa của
+// file, nên chọn lại đúng file sau khi tải lại trang sẽ gửi tiếp phần còn thiếu.
+(function () {
+    const RETRY_DELAYS = [1000, 2000, 5000, 10000, 20000, 30000];
+
+    function csrfToken() {
+        const meta = document.querySelector('meta[name="csrf-token"]');
+        return meta ? meta.content : '';
+    }
+
+    function sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    async function api(method, url, body, headers) {
+        const response = await fetch(url, {
+            method: method,
+            body: body,
+            credentials: 'same-origin',
+            headers: Object.assign({'X-CSRFToken': csrfToken()}, headers || {})
+        });
+        const data = response.status === 204 ? {} : await response.json().catch(() => ({}));
+        if (!response.ok) {
+            const error = new Error(data.error || ('HTTP ' + response.status));
+            error.status = response.status;
+            throw error;
+        }
+        return data;
+    }
+
+    async function withRetry(task, onRetry) {
+        for (let attempt = 0; ; attempt++) {
+            try {
+                return await task();
+            } catch (error) {
+                // Lỗi dữ liệu (4xx) không thử lại, trừ 409 (lệch vị trí) do người gọi xử lý
+                const retryable = !error.status || error.status >= 500;
+                if (!retryable || attempt >= RETRY_DELAYS.length) {
+                    throw error;
+                }
+                onRetry && onRetry(error, attempt);
+                await sleep(RETRY_DELAYS[attempt]);
+            }
+        }
+    }
+
+    async function sha256Hex(file) {
+        // Chỉ tính khi trình duyệt hỗ trợ và file không quá lớn để nạp vào bộ nhớ
+        if (!window.crypto || !crypto.subtle || file.size > 200 * 1024 * 1024) {
+            return null;
+        }
+        const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function openSession(file, productId, uploadType, storageKey) {
+        const saved = localStorage.getItem(storageKey);
+        if (saved) {
+            try {
+                return await api('GET', '/api/uploads/' + saved);
+            } catch (error) {
+                localStorage.removeItem(storageKey);
+            }
+        }
+        const state = await api('POST', '/api/uploads', JSON.stringify({
+            product_id: productId,
+            upload_type: uploadType,
+            filename: file.name,
+            size: file.size,
+            sha256: await sha256Hex(file)
+        }), {'Content-Type': 'application/json'});
+        localStorage.setItem(storageKey, state.upload_id);
+        return state;
+    }
+
+    async function upload(file, productId, uploadType, onProgress, onRetry) {
+        const storageKey = ['chunked-upload', productId, uploadType, file.name, file.size, file.lastModified].join(':');
+        let state = await openSession(file, productId, uploadType, storageKey);
+        const base = '/api/uploads/' + state.upload_id;
+
+        while (!state.complete) {
+            const end = Math.min(state.offset + state.chunk_size, file.size);
+            onProgress && onProgress(state.offset, file.size);
+            try {
+                state = await withRetry(
+                    () => api('PUT', base + '?offset=' + state.offset, file.slice(state.offset, end),
+                              {'Content-Type': 'application/octet-stream'}),
+                    onRetry
+                );
+            } catch (error) {
+                if (error.status !== 409) {
+                    throw error;
+                }
+                // Server đã nhận khác với máy khách nghĩ: hỏi lại vị trí rồi gửi tiếp
+                state = await withRetry(() => api('GET', base), onRetry);
+            }
+        }
+        onProgress && onProgress(file.size, file.size);
+
+        const result = await withRetry(() => api('POST', base + '/complete'), onRetry);
+        localStorage.removeItem(storageKey);
+        return result;
+    }
+
+    window.ChunkedUpload = {upload: upload};
+})();
@@ -0,0 +1,124 @@
+"""Lớp lưu trữ dữ liệu sản phẩm và người dùng
+
+Backend được chọn bằng config.STORAGE_BACKEND:
+- 'json': data.json và users.json (mặc định)
+- 'sqlite': một file SQLite, đọc/ghi theo từng bản ghi
+- 'sharded': mỗi sản phẩm một file JSON trong data/products/ kèm manifest
+
+Lượt quét QR không ghi thẳng vào backend: chúng được đệm trong bộ nhớ
+(scan_buffer), xả thành delta vào nhật ký scan (scan_log) rồi mới được gộp.
+"""
+import bisect
+import config
+
+_backend = None
+_scan_log = None
+_scan_buffer = None
+
+# Các trường cần cho trang danh sách (trang chủ, admin, API)
+LISTING_FIELDS = ('id', 'product_name', 'farmer_name', 'plant_type', 'planting_date', 'harvest_date',
+                  'production_area', 'created_by', 'created_at')
+
+# Các trường chỉ được cập nhật qua apply_scan_counts(), không qua update_product()
+SCAN_FIELDS = ('scan_count', 'last_scan')
+# Trạng thái xử lý media nền ({đường dẫn media: trạng thái}), chỉ cập nhật qua set_media_status()
+MEDIA_STATUS_FIELD = 'media_status'
+# Danh sách media của sản phẩm: sau khi tạo chỉ được nối thêm qua append_media()
+MEDIA_FIELDS = ('production_media', 'harvest_media')
+
+
+def listing_summary(product):
+    """Bản rút gọn của sản phẩm chỉ gồm các trường hiển thị trong danh sách"""
+    return {field: product.get(field) for field in LISTING_FIELDS if field in product}
+
+
+def page_ids(sorted_ids, before, limit):
+    """Cắt một trang (keyset) từ danh sách id tăng dần: các id < before, mới nhất trước.
+
+    Trả về (ids của trang, cursor cho trang sau hoặc None).
+    """
+    end = bisect.bisect_left(sorted_ids, before) if before else len(sorted_ids)
+    start = max(0, end - limit)
+    page = sorted_ids[start:end][::-1]
+    return page, (page[-1] if start > 0 and page else None)
+
+
+def keep_scan_fields(product, stored):
+    """Giữ bộ đếm lượt quét, danh sách và trạng thái xử lý media đang lưu khi ghi đè bản ghi sản phẩm.
+
+    Nhờ vậy bản sao cũ (đọc trước khi một upload chia khúc hoàn tất) không xóa
+    mất media vừa được append_media() thêm vào.
+    """
+    for field in SCAN_FIELDS + (MEDIA_STATUS_FIELD,) + MEDIA_FIELDS:
+        if field in stored:
+            product[field] = stored[field]
+        else:
+            product.pop(field, None)
+
+
+def add_scan_counts(product, count, last_scan):
+    """Cộng dồn lượt quét vào bản ghi sản phẩm"""
+    product['scan_count'] = product.get('scan_count', 0) + count
+    product['last_scan'] = max(product.get('last_scan') or '', last_scan)
+
+
+def apply_media_status(product, media_path, status):
+    """Đặt (status là dict) hoặc xóa (None) trạng thái xử lý của một file media"""
+    statuses = product.setdefault(MEDIA_STATUS_FIELD, {})
+    if status is None:
+        statuses.pop(media_path, None)
+    else:
+        statuses[media_path] = status
+    if not statuses:
+        del product[MEDIA_STATUS_FIELD]
+
+
+def add_media(product, field, media_paths, updated_at):
+    """Nối đường dẫn media vào product[field] ('production_media' hoặc 'harvest_media')"""
+    if field not in MEDIA_FIELDS:
+        raise ValueError(f'Trường media không hợp lệ: {field}')
+    product.setdefault(field, []).extend(media_paths)
+    product['updated_at'] = updated_at
+
+
+def create_backend(name):
+    """Tạo backend theo tên"""
+    if name == 'json':
+        from storage.json_backend import JsonBackend
+        return JsonBackend(config.DATA_FILE, config.USERS_FILE, config.DATA_FORMAT)
+    if name == 'json-lazy':
+        from storage.lazy_backend import LazyJsonBackend
+        return LazyJsonBackend(config.DATA_FILE, config.USERS_FILE, config.DATA_FORMAT)
+    if name == 'sqlite':
+        from storage.sqlite_backend import SqliteBackend
+        return SqliteBackend(config.SQLITE_FILE)
+    if name == 'sharded':
+        from storage.sharded_backend import ShardedBackend
+        return ShardedBackend(config.PRODUCTS_DIR, config.USERS_FILE, config.DATA_FORMAT)
+    raise ValueError(f"STORAGE_BACKEND không hợp lệ: {name}")
+
+
+def get_backend():
+    """Backend dùng chung trong tiến trình"""
+    global _backend
+    if _backend is None:
+        _backend = create_backend(config.STORAGE_BACKEND)
+    return _backend
+
+
+def get_scan_log():
+    """Nhật ký lượt quét dùng chung trong tiến trình"""
+    global _scan_log
+    if _scan_log is None:
+        from storage.scan_log import ScanLog
+        _scan_log = ScanLog(config.SCAN_LOG_FILE, get_backend, config.SCAN_COMPACT_INTERVAL)
+    return _scan_log
+
+
+def get_scan_buffer():
+    """Bộ đệm lượt quét dùng chung trong tiến trình"""
+    global _scan_buffer
+    if _scan_buffer is None:
+        from storage.scan_buffer import ScanBuffer
+        _scan_buffer = ScanBuffer(get_scan_log(), config.SCAN_FLUSH_INTERVAL, config.SCAN_FLUSH_THRESHOLD)
+    return _scan_buffer
@@ -0,0 +1,61 @@
+"""Định dạng lưu file dữ liệu: JSON thụt lề, JSON gọn, marshal hoặc msgpack.
+
+File nhị phân bắt đầu bằng một dòng đánh dấu (MAGIC) nên khi đọc không cần
+biết file được ghi bằng định dạng nào: đổi DATA_FORMAT hay chạy lệnh
+convert-data đều không làm hỏng việc đọc file cũ.
+"""
+import json
+import marshal
+
+try:
+    import msgpack
+except ImportError:  # Không bắt buộc, chỉ cần khi dùng định dạng 'msgpack'
+    msgpack = None
+
+FORMATS = ('json-indent', 'json', 'marshal', 'msgpack')
+
+MAGIC = {
+    'marshal': b'TXNG-MARSHAL\n',
+    'msgpack': b'TXNG-MSGPACK\n',
+}
+
+
+def available_formats():
+    """Các định dạng dùng được trong môi trường hiện tại"""
+    return tuple(fmt for fmt in FORMATS if fmt != 'msgpack' or msgpack is not None)
+
+
+def dumps(data, fmt):
+    """Mã hóa dữ liệu thành bytes theo định dạng `fmt`"""
+    if fmt == 'json-indent':
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+    if fmt == 'json':
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if fmt == 'marshal':
+        # marshal chỉ nhận kiểu cơ bản (dict, list, str, số...) giống JSON
+        return MAGIC['marshal'] + marshal.dumps(data)
+    if fmt == 'msgpack':
+        if msgpack is None:
+            raise ValueError("Định dạng 'msgpack' cần cài gói msgpack (pip install msgpack)")
+        return MAGIC['msgpack'] + msgpack.packb(data, use_bin_type=True)
+    raise ValueError(f'Định dạng dữ liệu không hợp lệ: {fmt}')
+
+
+def detect(raw):
+    """Định dạng của nội dung file: 'marshal', 'msgpack' hoặc 'json'"""
+    for fmt, magic in MAGIC.items():
+        if raw.startswith(magic):
+            return fmt
+    return 'json'
+
+
+def loads(raw):
+    """Giải mã nội dung file ở bất kỳ định dạng nào trong FORMATS"""
+    fmt = detect(raw)
+    if fmt == 'marshal':
+        return marshal.loads(raw[len(MAGIC['marshal']):])
+    if fmt == 'msgpack':
+        if msgpack is None:
+            raise ValueError('File dữ liệu ở định dạng msgpack nhưng chưa cài gói msgpack')
+        return msgpack.unpackb(raw[len(MAGIC['msgpack']):], raw=False)
+    return json.loads(raw)
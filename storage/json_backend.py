@@ -0,0 +1,282 @@
+"""Backend lưu trữ bằng file JSON (data.json, users.json)"""
+import bisect
+import copy
+import os
+import threading
+import storage
+from storage.json_file import CachedJsonFile
+from storage.search_index import SearchIndex
+
+
+class JsonBackend:
+    """Lưu toàn bộ sản phẩm trong data.json và user trong users.json.
+
+    Mỗi lần ghi vẫn phải ghi lại cả file; đọc theo khóa dùng bản đã cache.
+    Mọi thao tác ghi là một giao dịch đọc-sửa-ghi dưới khóa file và ghi
+    nguyên tử, nên nhiều worker gunicorn dùng chung file không mất cập nhật.
+    get_product/get_user trả về bản sao để route sửa rồi gọi update_*.
+    Index id → vị trí trong danh sách được giữ đồng bộ khi thêm/sửa/xóa nên
+    tìm sản phẩm theo id không phụ thuộc số lượng sản phẩm. Index phụ
+    người tạo → danh sách id (đã sắp xếp) giúp trang quản lý của một hộ chỉ
+    tốn O(số sản phẩm của hộ đó). users.json cũng được cache cùng index
+    username → user, nên tra cứu user mỗi request chỉ là một lần tra dict.
+    """
+
+    name = 'json'
+
+    def __init__(self, data_path, users_path, data_format='json-indent'):
+        self.data_file = CachedJsonFile(data_path, data_format)
+        self.users_file = CachedJsonFile(users_path)
+        self.users_lock = self.users_file.lock
+        self._lock = threading.RLock()
+        self._by_id = {}
+        self._by_owner = {}
+        self._sorted_ids = []
+        self._search = SearchIndex()
+        self._index_generation = None
+        self._users_by_name = {}
+        self._users_generation = None
+
+    # ----- Tài liệu đầy đủ (tương thích utils.load_data/save_data) -----
+
+    def data_exists(self):
+        return os.path.exists(self.data_file.path)
+
+    def load_data(self):
+        return self.data_file.load()
+
+    def save_data(self, data):
+        with self._lock, self.data_file.lock:
+            self.data_file.save(data)
+
+    def users_exist(self):
+        return os.path.exists(self.users_file.path)
+
+    def load_users(self):
+        return self.users_file.load()
+
+    def save_users(self, users_data):
+        with self.users_lock:
+            self.users_file.save(users_data)
+
+    # ----- Sản phẩm -----
+
+    def _index(self):
+        """Trả về (data, index id → vị trí), dựng lại các index khi data.json được đọc lại"""
+        data = self.data_file.load()
+        if self._index_generation != self.data_file.generation:
+            products = data.get('products', [])
+            self._by_id = {p.get('id'): i for i, p in enumerate(products)}
+            self._sorted_ids = sorted(self._by_id)
+            self._by_owner = {}
+            for p in products:
+                self._by_owner.setdefault(p.get('created_by'), []).append(p.get('id'))
+            for ids in self._by_owner.values():
+                ids.sort()
+            self._search.rebuild(products)
+            self._index_generation = self.data_file.generation
+        return data, self._by_id
+
+    def _records(self, data, index, ids):
+        products = data.get('products', [])
+        return [products[index[i]] for i in ids]
+
+    def _owner_add(self, product):
+        bisect.insort(self._by_owner.setdefault(product.get('created_by'), []), product.get('id'))
+
+    def _owner_remove(self, product):
+        ids = self._by_owner.get(product.get('created_by'), [])
+        i = bisect.bisect_left(ids, product.get('id'))
+        if i < len(ids) and ids[i] == product.get('id'):
+            ids.pop(i)
+
+    def _commit(self, data):
+        """Ghi data.json sau khi index đã được cập nhật tương ứng"""
+        self.data_file.save(data)
+        self._index_generation = self.data_file.generation
+
+    def _products(self):
+        return self.data_file.load().get('products', [])
+
+    def get_product(self, product_id):
+        with self._lock:
+            data, index = self._index()
+            pos = index.get(product_id)
+            return copy.deepcopy(data['products'][pos]) if pos is not None else None
+
+    def product_exists(self, product_id):
+        """Có sản phẩm này không: chỉ tra index, không đọc/sao chép bản ghi"""
+        with self._lock:
+            _, index = self._index()
+            return product_id in index
+
+    def list_products(self):
+        """Danh sách sản phẩm, mới nhất trước (chỉ đọc)"""
+        with self._lock:
+            data, index = self._index()
+            return self._records(data, index, reversed(self._sorted_ids))
+
+    def page_products(self, before=None, limit=20, query=None):
+        """Một trang sản phẩm có id < before, mới nhất trước (chỉ đọc).
+
+        Trả về (sản phẩm, cursor trang sau hoặc None).
+        """
+        with self._lock:
+            data, index = self._index()
+            ids = self._search.search(query) if query else self._sorted_ids
+            page, next_before = storage.page_ids(ids, before, limit)
+            return self._records(data, index, page), next_before
+
+    def list_products_by_owner(self, username):
+        """Sản phẩm của một người tạo, mới nhất trước (chỉ đọc)"""
+        with self._lock:
+            data, index = self._index()
+            return self._records(data, index, reversed(self._by_owner.get(username, [])))
+
+    def owns_product(self, username, product_id):
+        with self._lock:
+            self._index()
+            ids = self._by_owner.get(username, [])
+            i = bisect.bisect_left(ids, product_id)
+            return i < len(ids) and ids[i] == product_id
+
+    def recent_products(self, limit):
+        return sorted(self._products(), key=lambda x: x.get('created_at', ''), reverse=True)[:limit]
+
+    def count_products(self):
+        return len(self._products())
+
+    def add_product(self, product):
+        with self._lock, self.data_file.lock:
+            data, index = self._index()
+            products = data.setdefault('products', [])
+            products.append(product)
+            index[product['id']] = len(products) - 1
+            bisect.insort(self._sorted_ids, product['id'])
+            self._owner_add(product)
+            self._search.add(product)
+            self._commit(data)
+
+    def update_product(self, product):
+        with self._lock, self.data_file.lock:
+            data, index = self._index()
+            pos = index.get(product['id'])
+            if pos is None:
+                return False
+            products = data['products']
+            storage.keep_scan_fields(product, products[pos])
+            if products[pos].get('created_by') != product.get('created_by'):
+                self._owner_remove(products[pos])
+                self._owner_add(product)
+            products[pos] = product
+            self._search.add(product)
+            self._commit(data)
+            return True
+
+    def delete_product(self, product_id):
+        """Xóa sản phẩm, trả về bản ghi đã xóa hoặc None"""
+        with self._lock, self.data_file.lock:
+            data, index = self._index()
+            pos = index.pop(product_id, None)
+            if pos is None:
+                return None
+            products = data['products']
+            # Đưa bản ghi cuối vào chỗ trống để không phải dời vị trí cả danh sách
+            removed = products[pos]
+            self._owner_remove(removed)
+            self._sorted_ids.pop(bisect.bisect_left(self._sorted_ids, product_id))
+            self._search.remove(product_id)
+            last = products.pop()
+            if last is not removed:
+                products[pos] = last
+                index[last.get('id')] = pos
+            self._commit(data)
+            return removed
+
+    def apply_scan_counts(self, counts):
+        """Cộng dồn lượt quét: counts = {product_id: [số lượt, lần quét cuối]}"""
+        with self._lock, self.data_file.lock:
+            data, index = self._index()
+            changed = False
+            for product_id, (count, last_scan) in counts.items():
+                pos = index.get(product_id)
+                if pos is not None:
+                    storage.add_scan_counts(data['products'][pos], count, last_scan)
+                    changed = True
+            if changed:
+                self._commit(data)
+
+    def set_media_status(self, product_id, media_path, status):
+        """Ghi trạng thái xử lý nền của một file media, trả về False nếu không có sản phẩm"""
+        with self._lock, self.data_file.lock:
+            data, index = self._index()
+            pos = index.get(product_id)
+            if pos is None:
+                return False
+            storage.apply_media_status(data['products'][pos], media_path, status)
+            self._commit(data)
+            return True
+
+    def append_media(self, product_id, field, media_paths, updated_at):
+        """Nối media vào sản phẩm trong khóa ghi, trả về False nếu không có sản phẩm"""
+        with self._lock, self.data_file.lock:
+            data, index = self._index()
+            pos = index.get(product_id)
+            if pos is None:
+                return False
+            storage.add_media(data['products'][pos], field, media_paths, updated_at)
+            self._commit(data)
+            return True
+
+    # ----- Người dùng -----
+
+    def _user_index(self):
+        """Index username → user, dựng lại khi users.json được đọc lại"""
+        users_data = self.users_file.load()
+        if self._users_generation != self.users_file.generation:
+            self._users_by_name = {u.get('username'): u for u in users_data.get('users', [])}
+            self._users_generation = self.users_file.generation
+        return self._users_by_name
+
+    def get_user(self, username):
+        with self._lock:
+            user = self._user_index().get(username)
+            return copy.deepcopy(user) if user is not None else None
+
+    def list_users(self):
+        """Danh sách user (chỉ đọc)"""
+        return self.load_users().get('users', [])
+
+    def add_user(self, user):
+        with self.users_lock:
+            users_data = self.load_users()
+            users_data.setdefault('users', []).append(user)
+            self.save_users(users_data)
+
+    def update_user(self, user):
+        with self.users_lock:
+            users_data = self.load_users()
+            users = users_data.get('users', [])
+            for i, u in enumerate(users):
+                if u.get('username') == user['username']:
+                    users[i] = user
+                    self.save_users(users_data)
+                    return True
+            return False
+
+    def delete_user(self, username):
+        with self.users_lock:
+            users_data = self.load_users()
+            users = users_data.get('users', [])
+            remaining = [u for u in users if u.get('username') != username]
+            if len(remaining) == len(users):
+                return False
+            users_data['users'] = remaining
+            self.save_users(users_data)
+            return True
+
+    def stats(self):
+        stats = self.data_file.stats()
+        stats['backend'] = self.name
+        stats['users_cache'] = self.users_file.stats()
+        return stats
@@ -0,0 +1,183 @@
+"""File JSON: ghi nguyên tử, khóa liên tiến trình và bộ nhớ đệm trong tiến trình"""
+import os
+import tempfile
+import threading
+from storage import formats
+
+try:
+    import fcntl
+except ImportError:  # Windows (chỉ dùng khi chạy local)
+    fcntl = None
+    import msvcrt
+
+
+def atomic_write_stream(path, write):
+    """Ghi file qua file tạm cùng thư mục rồi đổi tên đè lên file cũ.
+
+    `write(f)` nhận file tạm (nhị phân) để ghi nội dung. Người đọc đồng thời
+    luôn thấy bản cũ hoặc bản mới đầy đủ, không bao giờ thấy file bị cắt dở.
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write(path, content):
+    """Ghi `content` (bytes) một cách nguyên tử, xem atomic_write_stream"""
+    atomic_write_stream(path, lambda f: f.write(content))
+
+
+def write_json(path, data, fmt='json-indent'):
+    """Ghi dữ liệu một cách nguyên tử (mặc định JSON thụt lề, xem storage.formats)"""
+    atomic_write(path, formats.dumps(data, fmt))
+
+
+class FileLock:
+    """Khóa độc quyền giữa các tiến trình (flock trên file <path>), dùng lồng nhau được.
+
+    Trong cùng tiến trình, các thread được tuần tự hóa bằng RLock; chỉ lần
+    vào ngoài cùng mới lấy khóa file, nên gọi lồng nhau không tự khóa chết.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._rlock.acquire()
+        if self._depth == 0:
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    if fcntl:
+                        fcntl.flock(fd, fcntl.LOCK_EX)
+                    else:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                except BaseException:
+                    os.close(fd)
+                    raise
+            except BaseException:
+                self._rlock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        if self._depth == 0:
+            fd, self._fd = self._fd, None
+            try:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            finally:
+                os.close(fd)
+        self._rlock.release()
+
+
+class CachedJsonFile:
+    """Giữ nội dung đã parse của một file JSON trong bộ nhớ.
+
+    File chỉ được đọc lại khi mtime, kích thước hoặc inode thay đổi, nên các
+    request liên tiếp dùng chung một bản đã parse thay vì gọi json.load mỗi lần.
+    Đối tượng trả về được dùng chung: người gọi sửa xong phải gọi save().
+    `generation` tăng mỗi khi đối tượng dữ liệu được thay thế (đọc lại hoặc
+    ghi), để các index dựng trên dữ liệu biết khi nào phải dựng lại.
+    `fmt` là định dạng khi ghi (storage.formats); khi đọc định dạng được tự
+    nhận biết từ nội dung file.
+
+    Ghi luôn nguyên tử (file tạm + đổi tên). Đọc-sửa-ghi phải nằm trong
+    `with cached.lock:`; load() trong khóa sẽ thấy bản mới nhất do worker
+    khác ghi vì đổi tên làm thay đổi inode của file.
+    """
+
+    def __init__(self, path, fmt='json-indent'):
+        self.path = path
+        self.fmt = fmt
+        self.lock = FileLock(path + '.lock')
+        self._lock = threading.RLock()
+        self._data = None
+        self._stamp = None
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+
+    def _file_stamp(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def load(self):
+        """Trả về dữ liệu đã cache, đọc lại file nếu file đã bị thay đổi"""
+        with self._lock:
+            # Lấy stamp trước khi đọc: nếu file đổi trong lúc đọc thì lần sau sẽ đọc lại
+            stamp = self._file_stamp()
+            if self._data is not None and stamp == self._stamp:
+                self.hits += 1
+                return self._data
+
+            self.misses += 1
+            with open(self.path, 'rb') as f:
+                data = formats.loads(f.read())
+            self._data = data
+            self._stamp = stamp
+            self.generation += 1
+            return data
+
+    def save(self, data):
+        """Ghi dữ liệu xuống file và cập nhật cache"""
+        with self._lock:
+            try:
+                write_json(self.path, data, self.fmt)
+            except Exception:
+                self.invalidate()
+                raise
+            self._data = data
+            self._stamp = self._file_stamp()
+            self.generation += 1
+
+    def convert(self, fmt):
+        """Ghi lại file theo định dạng mới, trả về (số byte trước, số byte sau)"""
+        with self.lock:
+            before = os.path.getsize(self.path)
+            data = self.load()
+            self.fmt = fmt
+            self.save(data)
+            return before, os.path.getsize(self.path)
+
+    def invalidate(self):
+        """Bỏ cache, lần load() sau sẽ đọc lại file"""
+        with self._lock:
+            self._data = None
+            self._stamp = None
+            self.generation += 1
+
+    def stats(self):
+        """Thống kê cache (theo từng tiến trình/worker)"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'path': self.path,
+                'format': self.fmt,
+                'pid': os.getpid(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'cached': self._data is not None,
+            }
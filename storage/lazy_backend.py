@@ -0,0 +1,109 @@
+"""Backend JSON đọc data.json tuần tự, nạp bản ghi đầy đủ khi cần"""
+import storage
+from storage.json_backend import JsonBackend
+from storage.lazy_file import LazyJsonFile
+
+
+class LazyJsonBackend(JsonBackend):
+    """Dùng chung data.json/users.json với backend JSON nhưng không parse cả file.
+
+    Các index (id, người tạo, tìm kiếm, phân trang) của JsonBackend được dựng
+    trên bản tóm tắt LISTING_FIELDS do LazyJsonFile đọc tuần tự, giống backend
+    sharded dựng trên manifest. Mô tả, danh sách media... chỉ được đọc khi
+    mở trang một sản phẩm. Mỗi lần ghi chép lại các bản ghi khác theo byte
+    và chỉ mã hóa bản ghi thay đổi.
+    """
+
+    name = 'json-lazy'
+
+    def __init__(self, data_path, users_path, data_format='json-indent'):
+        super().__init__(data_path, users_path)
+        self.data_file = LazyJsonFile(data_path, data_format)
+
+    # ----- Tài liệu đầy đủ (tương thích utils.load_data/save_data) -----
+
+    def load_data(self):
+        return self.data_file.load_full()
+
+    def save_data(self, data):
+        with self._lock, self.data_file.lock:
+            if self.data_exists():
+                self._index()
+            products = data.get('products', [])
+            for product in products:
+                self.data_file.stage(product)
+            document = {k: v for k, v in data.items() if k != 'products'}
+            document['products'] = [storage.listing_summary(p) for p in products]
+            self.data_file.save(document)
+
+    # ----- Sản phẩm -----
+
+    def get_product(self, product_id):
+        with self._lock:
+            _, index = self._index()
+            if product_id not in index:
+                return None
+            return self.data_file.read_product(product_id)
+
+    def add_product(self, product):
+        with self._lock, self.data_file.lock:
+            self._index()
+            self.data_file.stage(product)
+            super().add_product(storage.listing_summary(product))
+
+    def update_product(self, product):
+        with self._lock, self.data_file.lock:
+            _, index = self._index()
+            if product['id'] not in index:
+                return False
+            storage.keep_scan_fields(product, self.data_file.read_product(product['id']))
+            self.data_file.stage(product)
+            return super().update_product(storage.listing_summary(product))
+
+    def delete_product(self, product_id):
+        """Xóa sản phẩm, trả về bản ghi đã xóa hoặc None"""
+        with self._lock, self.data_file.lock:
+            product = self.get_product(product_id)
+            if product is None:
+                return None
+            super().delete_product(product_id)
+            return product
+
+    def apply_scan_counts(self, counts):
+        """Cộng dồn lượt quét: chỉ mã hóa lại bản ghi của các sản phẩm được quét"""
+        with self._lock, self.data_file.lock:
+            data, index = self._index()
+            changed = False
+            for product_id, (count, last_scan) in counts.items():
+                if product_id not in index:
+                    continue
+                product = self.data_file.read_product(product_id)
+                storage.add_scan_counts(product, count, last_scan)
+                self.data_file.stage(product)
+                changed = True
+            if changed:
+                self._commit(data)
+
+    def set_media_status(self, product_id, media_path, status):
+        """Ghi trạng thái xử lý nền của một file media: chỉ mã hóa lại bản ghi đó"""
+        with self._lock, self.data_file.lock:
+            data, index = self._index()
+            if product_id not in index:
+                return False
+            product = self.data_file.read_product(product_id)
+            storage.apply_media_status(product, media_path, status)
+            self.data_file.stage(product)
+            self._commit(data)
+            return True
+
+    def append_media(self, product_id, field, media_paths, updated_at):
+        """Nối media vào sản phẩm trong khóa ghi: chỉ mã hóa lại bản ghi đó"""
+        with self._lock, self.data_file.lock:
+            data, index = self._index()
+            if product_id not in index:
+                return False
+            product = self.data_file.read_product(product_id)
+            storage.add_media(product, field, media_paths, updated_at)
+            self.data_file.stage(product)
+            self._commit(data)
+            return True
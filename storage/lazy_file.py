@@ -0,0 +1,303 @@
+"""Đọc data.json tuần tự: chỉ giữ index danh sách, đọc bản ghi đầy đủ khi cần"""
+import codecs
+import json
+import os
+import shutil
+import threading
+import storage
+from storage import formats
+from storage.json_file import FileLock, atomic_write_stream
+
+CHUNK_SIZE = 64 * 1024
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = ' \t\r\n'
+
+
+class _Reader:
+    """Bộ đọc JSON theo từng khúc, theo dõi vị trí byte của từng giá trị"""
+
+    def __init__(self, f, chunk_size):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self.offset = 0  # Vị trí byte trong file tương ứng với _buf[_pos]
+        self._eof = False
+
+    def _fill(self):
+        chunk = self._f.read(self._chunk_size)
+        self._eof = not chunk
+        # Bỏ phần đã đọc xong để bộ đệm chỉ lớn cỡ một phần tử
+        self._buf = self._buf[self._pos:] + self._decoder.decode(chunk, final=self._eof)
+        self._pos = 0
+
+    def peek(self):
+        """Ký tự kế tiếp sau khoảng trắng ('' khi hết file)"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+                self.offset += 1
+            if self._pos < len(self._buf) or self._eof:
+                return self._buf[self._pos:self._pos + 1]
+            self._fill()
+
+    def expect(self, chars):
+        ch = self.peek()
+        if not ch or ch not in chars:
+            raise ValueError(f'JSON không hợp lệ tại byte {self.offset}: cần {chars!r}, gặp {ch!r}')
+        self._pos += 1
+        self.offset += 1
+        return ch
+
+    def value(self):
+        """Đọc một giá trị JSON, trả về (giá trị, vị trí byte, độ dài byte)"""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buf, self._pos)
+                # Số ở cuối bộ đệm có thể còn chữ số trong khúc sau
+                if end < len(self._buf) or self._eof:
+                    break
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+        start = self.offset
+        self.offset += len(self._buf[self._pos:end].encode('utf-8'))
+        self._pos = end
+        return value, start, self.offset - start
+
+
+def iter_document(f, chunk_size=CHUNK_SIZE):
+    """Đọc tuần tự file JSON dạng {"products": [...], ...} mở ở chế độ nhị phân.
+
+    Mỗi sản phẩm trả về ('products', sản phẩm, (vị trí byte, độ dài byte));
+    các khóa khác ở cấp ngoài cùng trả về (khóa, giá trị, None). Tại mỗi thời
+    điểm chỉ một phần tử được giữ trong bộ nhớ.
+    """
+    reader = _Reader(f, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key, _, _ = reader.value()
+        reader.expect(':')
+        if key == 'products' and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    product, offset, length = reader.value()
+                    yield key, product, (offset, length)
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            value, _, _ = reader.value()
+            yield key, value, None
+        if reader.expect(',}') == '}':
+            return
+
+
+def _stamp(st):
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class LazyJsonFile:
+    """Thay CachedJsonFile cho backend json-lazy.
+
+    load() duyệt data.json một lượt và chỉ giữ các trường LISTING_FIELDS của
+    mỗi sản phẩm cùng vị trí byte của bản ghi trong file, nên bộ nhớ và thời
+    gian khởi động tỉ lệ với index chứ không với phần mô tả/danh sách media.
+    read_product() đọc đúng đoạn byte của một bản ghi khi cần.
+
+    Khi ghi, các bản ghi không đổi được chép nguyên đoạn byte từ file cũ;
+    chỉ bản ghi đã stage() được mã hóa lại. Giống CachedJsonFile, đọc-sửa-ghi
+    phải nằm trong `with lazy.lock:`.
+    """
+
+    def __init__(self, path, fmt='json-indent', chunk_size=CHUNK_SIZE):
+        self.path = path
+        # Chỉ ghi được JSON; 'json' ghi gọn, các định dạng khác ghi thụt lề
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.lock = FileLock(path + '.lock')
+        self._lock = threading.RLock()
+        self._data = None
+        self._spans = {}
+        self._stamp = None
+        self._staged = {}
+        self.hits = 0
+        self.misses = 0
+        self.body_reads = 0
+        self.generation = 0
+
+    def load(self):
+        """Trả về {'products': [bản tóm tắt]}, duyệt lại file nếu file đã bị thay đổi"""
+        with self._lock:
+            stamp = _stamp(os.stat(self.path))
+            if self._data is not None and stamp == self._stamp:
+                self.hits += 1
+                return self._data
+
+            self.misses += 1
+            with open(self.path, 'rb') as f:
+                # Stamp lấy từ file đang mở để vị trí byte khớp đúng nội dung đã đọc
+                stamp = _stamp(os.fstat(f.fileno()))
+                if formats.detect(f.read(16)) != 'json':
+                    raise ValueError(f'{self.path} không ở định dạng JSON, hãy chạy '
+                                     f'STORAGE_BACKEND=json flask --app app convert-data --to json')
+                f.seek(0)
+                data, spans = {}, {}
+                products = data['products'] = []
+                for key, value, span in iter_document(f, self.chunk_size):
+                    if span is None:
+                        data[key] = value
+                        continue
+                    products.append(storage.listing_summary(value))
+                    spans[value.get('id')] = span
+            self._data = data
+            self._spans = spans
+            self._stamp = stamp
+            self.generation += 1
+            return data
+
+    def _read_span(self, product_id):
+        with self._lock:
+            self.load()
+            span = self._spans.get(product_id)
+            if span is None:
+                return None, True
+            with open(self.path, 'rb') as f:
+                if _stamp(os.fstat(f.fileno())) != self._stamp:
+                    # File vừa bị worker khác thay thế sau lần load()
+                    return None, False
+                f.seek(span[0])
+                raw = f.read(span[1])
+            self.body_reads += 1
+            return json.loads(raw), True
+
+    def read_product(self, product_id):
+        """Bản ghi đầy đủ của một sản phẩm (bản mới, người gọi được sửa) hoặc None"""
+        product, ok = self._read_span(product_id)
+        if not ok:
+            # Đọc lại trong khóa file để không worker nào thay file giữa chừng
+            with self.lock:
+                product, ok = self._read_span(product_id)
+        return product
+
+    def load_full(self):
+        """Đọc toàn bộ tài liệu (mọi trường của mọi sản phẩm)"""
+        with open(self.path, 'rb') as f:
+            return formats.loads(f.read())
+
+    def stage(self, product):
+        """Đánh dấu bản ghi đầy đủ sẽ được ghi ở lần save() kế tiếp"""
+        with self._lock:
+            self._staged[product['id']] = product
+
+    def _encode(self, product):
+        if self.fmt == 'json':
+            return json.dumps(product, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        # Cùng bố cục với json.dump(data, indent=2)
+        text = json.dumps(product, ensure_ascii=False, indent=2)
+        return text.replace('\n', '\n    ').encode('utf-8')
+
+    def save(self, data):
+        """Ghi file từ danh sách tóm tắt trong `data` và các bản ghi đã stage()"""
+        compact = self.fmt == 'json'
+        products = data.get('products', [])
+        extra = {k: v for k, v in data.items() if k != 'products'}
+
+        with self._lock:
+            staged, self._staged = self._staged, {}
+            spans = {}
+
+            def write(f):
+                src = None
+                if self._spans:
+                    src = open(self.path, 'rb')
+                    if _stamp(os.fstat(src.fileno())) != self._stamp:
+                        src.close()
+                        raise RuntimeError(f'{self.path} đã thay đổi từ lần đọc trước')
+                try:
+                    if compact:
+                        head = json.dumps(extra, ensure_ascii=False, separators=(',', ':'))[:-1]
+                        f.write((head + (',' if extra else '') + '"products":[').encode('utf-8'))
+                    else:
+                        head = json.dumps(extra, ensure_ascii=False, indent=2)[:-2] + ',\n' if extra else '{\n'
+                        f.write((head + '  "products": [').encode('utf-8'))
+                    for i, summary in enumerate(products):
+                        product_id = summary.get('id')
+                        if compact:
+                            f.write(b',' if i else b'')
+                        else:
+                            f.write(b',\n    ' if i else b'\n    ')
+                        offset = f.tell()
+                        if product_id in staged:
+                            f.write(self._encode(staged[product_id]))
+                        else:
+                            old_offset, length = self._spans[product_id]
+                            src.seek(old_offset)
+                            shutil.copyfileobj(_limited(src, length), f)
+                        spans[product_id] = (offset, f.tell() - offset)
+                    if compact:
+                        f.write(b']}')
+                    else:
+                        f.write(b'\n  ]\n}' if products else b']\n}')
+                finally:
+                    if src is not None:
+                        src.close()
+
+            try:
+                atomic_write_stream(self.path, write)
+            except Exception:
+                self.invalidate()
+                raise
+            self._data = data
+            self._spans = spans
+            self._stamp = _stamp(os.stat(self.path))
+            self.generation += 1
+
+    def invalidate(self):
+        """Bỏ cache, lần load() sau sẽ duyệt lại file"""
+        with self._lock:
+            self._data = None
+            self._spans = {}
+            self._stamp = None
+            self._staged = {}
+            self.generation += 1
+
+    def stats(self):
+        """Thống kê cache (theo từng tiến trình/worker)"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'path': self.path,
+                'format': 'json (lazy)',
+                'pid': os.getpid(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'cached': self._data is not None,
+                'products': len(self._spans),
+                'body_reads': self.body_reads,
+            }
+
+
+class _limited:
+    """Đọc tối đa `length` byte từ file (cho shutil.copyfileobj)"""
+
+    def __init__(self, f, length):
+        self._f = f
+        self._left = length
+
+    def read(self, size=-1):
+        if self._left <= 0:
+            return b''
+        size = self._left if size < 0 else min(size, self._left)
+        chunk = self._f.read(size)
+        self._left -= len(chunk)
+        return chunk
@@ -0,0 +1,83 @@
+"""Bộ đệm lượt quét QR trong bộ nhớ, xả định kỳ vào nhật ký scan"""
+import atexit
+import os
+import threading
+import time
+
+
+class ScanBuffer:
+    """Cộng dồn lượt quét trong bộ nhớ của worker trước khi ghi.
+
+    Khi một sản phẩm bị quét hàng nghìn lần mỗi giờ, mỗi lần xả chỉ ghi một
+    dòng (product_id, số lượt, lần quét cuối) cho mỗi sản phẩm thay vì một
+    dòng cho mỗi lượt. Bộ đệm được xả khi đủ `threshold` lượt, khi quá
+    `interval` giây, và khi worker tắt. Dữ liệu xả ra là phần chênh lệch
+    (delta) nên các worker gunicorn được cộng dồn, không ghi đè lẫn nhau.
+    """
+
+    def __init__(self, scan_log, interval, threshold):
+        self.scan_log = scan_log
+        self.interval = interval
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pending_total = 0
+        self._last_flush = time.monotonic()
+        self._thread_pid = None
+
+    def add(self, product_id):
+        """Ghi nhận một lượt quét"""
+        self.start()
+        when = time.strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            entry = self._pending.setdefault(product_id, [0, when])
+            entry[0] += 1
+            entry[1] = when
+            self._pending_total += 1
+            due = (self._pending_total >= self.threshold or
+                   time.monotonic() - self._last_flush >= self.interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Xả toàn bộ delta đang đệm vào nhật ký scan, trả về số lượt đã xả"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            total, self._pending_total = self._pending_total, 0
+            self._last_flush = time.monotonic()
+
+        for product_id, (count, when) in pending.items():
+            try:
+                self.scan_log.record(product_id, count, when)
+            except Exception as e:
+                print(f"Lỗi khi xả lượt quét của sản phẩm {product_id}: {str(e)}")
+                # Trả lại bộ đệm để lần xả sau thử tiếp
+                with self._lock:
+                    entry = self._pending.setdefault(product_id, [0, when])
+                    entry[0] += count
+                    entry[1] = max(entry[1], when)
+                    self._pending_total += count
+                total -= count
+        return total
+
+    def start(self):
+        """Khởi động luồng xả định kỳ (mỗi tiến trình một luồng)"""
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            # Sau fork, phần đệm của tiến trình cha không thuộc về worker này
+            self._pending = {}
+            self._pending_total = 0
+            threading.Thread(target=self._run, name='scan-buffer-flusher', daemon=True).start()
+        # Đăng ký sau nhật ký scan để khi tắt worker bộ đệm được xả trước lần gộp cuối
+        self.scan_log.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if time.monotonic() - self._last_flush >= self.interval:
+                self.flush()
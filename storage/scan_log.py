@@ -0,0 +1,129 @@
+"""Nhật ký lượt quét QR (append-only) và bộ gộp chạy nền"""
+import atexit
+import glob
+import itertools
+import json
+import os
+import threading
+import time
+
+# Segment vừa được đổi tên có thể còn nhận vài lần ghi đang dở từ worker khác,
+# nên chỉ gộp segment đã được nhận quá khoảng thời gian này (giây)
+CLAIM_GRACE = 1.0
+
+
+class ScanLog:
+    """Ghi mỗi lượt quét thành một dòng nối vào cuối file log.
+
+    Luồng nền định kỳ đổi tên file log thành một segment, cộng dồn số lượt
+    quét theo sản phẩm rồi ghi vào backend bằng apply_scan_counts(). Đường
+    quét QR vì vậy chỉ tốn một lần append, không phải ghi lại toàn bộ dữ liệu.
+    Đổi tên file là thao tác nguyên tử nên nhiều worker gunicorn có thể dùng
+    chung một log: mỗi segment chỉ được một worker nhận.
+    """
+
+    def __init__(self, path, get_backend, interval):
+        self.path = path
+        self.get_backend = get_backend
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread_pid = None
+        self._seq = itertools.count()
+
+    def record(self, product_id, count=1, when=None):
+        """Ghi nhận lượt quét (O(1), không đọc dữ liệu sản phẩm)"""
+        when = when or time.strftime('%Y-%m-%d %H:%M:%S')
+        line = json.dumps([product_id, count, when], ensure_ascii=False) + '\n'
+        # O_APPEND: mỗi lần write() nối nguyên dòng vào cuối file, kể cả khi nhiều tiến trình cùng ghi
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode('utf-8'))
+        finally:
+            os.close(fd)
+        self.start()
+
+    def start(self):
+        """Khởi động luồng gộp nền (mỗi tiến trình một luồng)"""
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._run, name='scan-log-compactor', daemon=True).start()
+            atexit.register(self.compact, final=True)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"Lỗi khi gộp log lượt quét: {str(e)}")
+
+    def _claim(self):
+        """Đổi tên log hiện tại (và segment bị bỏ dở quá lâu) thành segment của tiến trình này"""
+        now = time.time()
+        stale_after = max(self.interval * 10, 60)
+        candidates = [self.path]
+        for segment in glob.glob(f'{self.path}.*.compacting'):
+            try:
+                if not os.path.basename(segment).startswith(f'{os.path.basename(self.path)}.{os.getpid()}.') \
+                        and now - os.path.getmtime(segment) > stale_after:
+                    candidates.append(segment)
+            except OSError:
+                continue
+
+        for source in candidates:
+            target = f'{self.path}.{os.getpid()}.{int(now * 1000)}-{next(self._seq)}.compacting'
+            try:
+                os.rename(source, target)
+                # mtime = thời điểm nhận, để worker khác không coi là segment bị bỏ dở
+                os.utime(target)
+            except FileNotFoundError:
+                continue
+
+    def _own_segments(self, max_claimed_at):
+        prefix = f'{os.path.basename(self.path)}.{os.getpid()}.'
+        segments = []
+        for segment in glob.glob(f'{self.path}.{os.getpid()}.*.compacting'):
+            claimed_at = int(os.path.basename(segment)[len(prefix):].split('-')[0]) / 1000
+            if claimed_at <= max_claimed_at:
+                segments.append(segment)
+        return sorted(segments)
+
+    def compact(self, final=False):
+        """Gộp các segment vào bộ đếm của sản phẩm, trả về số lượt quét đã gộp"""
+        with self._lock:
+            self._claim()
+            if final:
+                time.sleep(CLAIM_GRACE)
+            segments = self._own_segments(time.time() - (0 if final else CLAIM_GRACE))
+            if not segments:
+                return 0
+
+            counts = {}
+            for segment in segments:
+                try:
+                    f = open(segment, 'r', encoding='utf-8')
+                except FileNotFoundError:
+                    continue
+                with f:
+                    for line in f:
+                        try:
+                            product_id, count, when = json.loads(line)
+                        except ValueError:
+                            # Dòng bị cắt dở khi tiến trình ghi bị dừng đột ngột
+                            continue
+                        entry = counts.setdefault(product_id, [0, ''])
+                        entry[0] += count
+                        entry[1] = max(entry[1], when)
+
+            if counts:
+                self.get_backend().apply_scan_counts(counts)
+            for segment in segments:
+                try:
+                    os.remove(segment)
+                except FileNotFoundError:
+                    pass
+            return sum(entry[0] for entry in counts.values())
@@ -0,0 +1,106 @@
+"""Chỉ mục tìm kiếm sản phẩm (inverted index, bỏ dấu tiếng Việt)"""
+import bisect
+import re
+import unicodedata
+
+# Các trường được tìm kiếm trên trang chủ
+SEARCH_FIELDS = ('product_name', 'farmer_name', 'production_area')
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def fold_text(text):
+    """Chữ thường, bỏ dấu tiếng Việt: 'Bòn bon Tiên Châu' -> 'bon bon tien chau'"""
+    text = (text or '').lower().replace('đ', 'd')
+    text = unicodedata.normalize('NFD', text)
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    """Tách văn bản đã bỏ dấu thành các từ"""
+    return _TOKEN_RE.findall(fold_text(text))
+
+
+def product_tokens(product):
+    """Tập từ khóa của một sản phẩm trên các trường tìm kiếm"""
+    tokens = set()
+    for field in SEARCH_FIELDS:
+        tokens.update(tokenize(product.get(field, '')))
+    return tokens
+
+
+class SearchIndex:
+    """Inverted index từ → tập id sản phẩm, cập nhật từng bản ghi.
+
+    Mỗi từ trong truy vấn được so khớp theo tiền tố ('tien' khớp 'tiên',
+    'tiền'...) bằng cách tìm nhị phân trên danh sách từ đã sắp xếp; kết quả
+    là các sản phẩm khớp tất cả các từ.
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._doc_tokens = {}
+        self._vocab = []
+
+    def rebuild(self, products):
+        self._postings = {}
+        self._doc_tokens = {}
+        for product in products:
+            tokens = product_tokens(product)
+            self._doc_tokens[product.get('id')] = tokens
+            for token in tokens:
+                self._postings.setdefault(token, set()).add(product.get('id'))
+        self._vocab = sorted(self._postings)
+
+    def add(self, product):
+        """Thêm hoặc cập nhật một sản phẩm"""
+        product_id = product.get('id')
+        self.remove(product_id)
+        tokens = product_tokens(product)
+        self._doc_tokens[product_id] = tokens
+        for token in tokens:
+            ids = self._postings.get(token)
+            if ids is None:
+                ids = self._postings[token] = set()
+                bisect.insort(self._vocab, token)
+            ids.add(product_id)
+
+    def remove(self, product_id):
+        for token in self._doc_tokens.pop(product_id, ()):
+            ids = self._postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(product_id)
+            if not ids:
+                del self._postings[token]
+                i = bisect.bisect_left(self._vocab, token)
+                if i < len(self._vocab) and self._vocab[i] == token:
+                    self._vocab.pop(i)
+
+    def _prefix_ids(self, prefix):
+        exact = self._postings.get(prefix)
+        start = bisect.bisect_left(self._vocab, prefix)
+        end = bisect.bisect_left(self._vocab, prefix + '\uffff')
+        if end - start == 1 and exact is not None:
+            return exact
+        ids = set()
+        for token in self._vocab[start:end]:
+            ids |= self._postings[token]
+        return ids
+
+    def search(self, query):
+        """Trả về id các sản phẩm khớp mọi từ trong truy vấn, sắp xếp tăng dần"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        candidates = [self._prefix_ids(term) for term in terms]
+        if not all(candidates):
+            return []
+        # Giao từ tập nhỏ nhất để số phần tử phải xét giảm nhanh nhất
+        candidates.sort(key=len)
+        matches = candidates[0]
+        for ids in candidates[1:]:
+            matches = matches & ids
+            if not matches:
+                return []
+        return sorted(matches)
@@ -0,0 +1,132 @@
+"""Backend lưu mỗi sản phẩm một file JSON, kèm manifest cho trang danh sách"""
+import json
+import os
+import storage
+from storage.json_backend import JsonBackend
+from storage.json_file import write_json
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class ShardedBackend(JsonBackend):
+    """Mỗi sản phẩm nằm trong data/products/<id>.json.
+
+    manifest.json chỉ chứa các trường LISTING_FIELDS của mọi sản phẩm; các
+    index (id, người tạo, tìm kiếm, phân trang) của JsonBackend được dựng trên
+    manifest nên trang danh sách không phải mở file từng sản phẩm. Sửa hoặc
+    cộng lượt quét chỉ ghi lại file của sản phẩm đó; manifest chỉ được ghi lại
+    khi thêm/xóa sản phẩm hoặc khi trường hiển thị trong danh sách thay đổi.
+    User vẫn nằm trong users.json như backend JSON. Các thao tác ghi dùng
+    chung khóa file của manifest. DATA_FORMAT chỉ áp dụng cho manifest, file
+    từng sản phẩm luôn là JSON.
+    """
+
+    name = 'sharded'
+
+    def __init__(self, products_dir, users_path, data_format='json-indent'):
+        super().__init__(os.path.join(products_dir, MANIFEST_NAME), users_path, data_format)
+        self.products_dir = products_dir
+        os.makedirs(products_dir, exist_ok=True)
+
+    def _product_path(self, product_id):
+        return os.path.join(self.products_dir, f'{product_id}.json')
+
+    def _read_product(self, product_id):
+        with open(self._product_path(product_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_product(self, product):
+        write_json(self._product_path(product['id']), product)
+
+    # ----- Tài liệu đầy đủ (tương thích utils.load_data/save_data) -----
+
+    def load_data(self):
+        with self._lock:
+            return {'products': [self._read_product(p['id']) for p in self._products()]}
+
+    def save_data(self, data):
+        with self._lock, self.data_file.lock:
+            products = data.get('products', [])
+            old_ids = {p['id'] for p in self._products()} if self.data_exists() else set()
+            for product in products:
+                self._write_product(product)
+                old_ids.discard(product['id'])
+            for product_id in old_ids:
+                os.remove(self._product_path(product_id))
+            self.data_file.save({'products': [storage.listing_summary(p) for p in products]})
+
+    # ----- Sản phẩm -----
+
+    def get_product(self, product_id):
+        with self._lock:
+            _, index = self._index()
+            if product_id not in index:
+                return None
+            return self._read_product(product_id)
+
+    def add_product(self, product):
+        with self._lock, self.data_file.lock:
+            self._write_product(product)
+            super().add_product(storage.listing_summary(product))
+
+    def update_product(self, product):
+        with self._lock, self.data_file.lock:
+            data, index = self._index()
+            pos = index.get(product['id'])
+            if pos is None:
+                return False
+            storage.keep_scan_fields(product, self._read_product(product['id']))
+            self._write_product(product)
+            summary = storage.listing_summary(product)
+            if data['products'][pos] != summary:
+                super().update_product(summary)
+            return True
+
+    def delete_product(self, product_id):
+        """Xóa sản phẩm, trả về bản ghi đã xóa hoặc None"""
+        with self._lock, self.data_file.lock:
+            product = self.get_product(product_id)
+            if product is None:
+                return None
+            super().delete_product(product_id)
+            os.remove(self._product_path(product_id))
+            return product
+
+    def apply_scan_counts(self, counts):
+        """Cộng dồn lượt quét: chỉ ghi lại file của các sản phẩm được quét"""
+        with self._lock, self.data_file.lock:
+            _, index = self._index()
+            for product_id, (count, last_scan) in counts.items():
+                if product_id not in index:
+                    continue
+                product = self._read_product(product_id)
+                storage.add_scan_counts(product, count, last_scan)
+                self._write_product(product)
+
+    def set_media_status(self, product_id, media_path, status):
+        """Ghi trạng thái xử lý nền của một file media: chỉ ghi lại file của sản phẩm đó"""
+        with self._lock, self.data_file.lock:
+            _, index = self._index()
+            if product_id not in index:
+                return False
+            product = self._read_product(product_id)
+            storage.apply_media_status(product, media_path, status)
+            self._write_product(product)
+            return True
+
+    def append_media(self, product_id, field, media_paths, updated_at):
+        """Nối media vào sản phẩm trong khóa ghi: chỉ ghi lại file của sản phẩm đó"""
+        with self._lock, self.data_file.lock:
+            _, index = self._index()
+            if product_id not in index:
+                return False
+            product = self._read_product(product_id)
+            storage.add_media(product, field, media_paths, updated_at)
+            self._write_product(product)
+            return True
+
+    # ----- Chuyển dữ liệu -----
+
+    def import_documents(self, data, users_data):
+        """Nhập dữ liệu từ data.json; users.json được dùng chung nên giữ nguyên"""
+        self.save_data(data)
@@ -0,0 +1,304 @@
+"""Backend lưu trữ bằng SQLite"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+import storage
+from storage.search_index import SEARCH_FIELDS, fold_text, tokenize
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS products (
+    id TEXT PRIMARY KEY,
+    created_by TEXT,
+    created_at TEXT,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_products_created_by ON products(created_by, id);
+CREATE INDEX IF NOT EXISTS idx_products_created_at ON products(created_at);
+
+-- Chỉ mục tìm kiếm: văn bản đã bỏ dấu của các trường SEARCH_FIELDS,
+-- rowid trùng với rowid của bảng products
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    text,
+    tokenize = 'unicode61 remove_diacritics 0',
+    prefix = '2 3'
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+'''
+
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False)
+
+
+def _search_text(product):
+    return ' '.join(fold_text(product.get(field, '')) for field in SEARCH_FIELDS)
+
+
+class SqliteBackend:
+    """Mỗi sản phẩm/user là một dòng; đọc theo khóa và ghi từng dòng.
+
+    Các cột id, created_by, created_at được tách ra để đánh index, phần còn
+    lại của bản ghi nằm trong cột body (JSON) nên không cần đổi schema khi
+    thêm trường mới.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        # Mỗi thread/tiến trình một kết nối riêng (sqlite3 không chia sẻ qua fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        self._fill_search_index(conn)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _fill_search_index(self, conn):
+        """Dựng chỉ mục tìm kiếm cho CSDL tạo trước khi có bảng products_fts"""
+        if conn.execute('SELECT 1 FROM products_fts LIMIT 1').fetchone():
+            return
+        rows = conn.execute('SELECT body FROM products').fetchall()
+        if rows:
+            conn.execute('BEGIN IMMEDIATE')
+            self._index_search(conn, [json.loads(row[0]) for row in rows])
+            conn.execute('COMMIT')
+
+    def _index_search(self, conn, products):
+        conn.executemany(
+            'DELETE FROM products_fts WHERE rowid = (SELECT rowid FROM products WHERE id = ?)',
+            [(p['id'],) for p in products]
+        )
+        conn.executemany(
+            'INSERT INTO products_fts (rowid, text) SELECT rowid, ? FROM products WHERE id = ?',
+            [(_search_text(p), p['id']) for p in products]
+        )
+
+    def _fetch_bodies(self, sql, params=()):
+        return [json.loads(row[0]) for row in self._connect().execute(sql, params)]
+
+    # ----- Tài liệu đầy đủ (tương thích utils.load_data/save_data) -----
+
+    def data_exists(self):
+        return True
+
+    def load_data(self):
+        return {'products': self._fetch_bodies('SELECT body FROM products ORDER BY rowid')}
+
+    def save_data(self, data):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM products')
+            conn.execute('DELETE FROM products_fts')
+            self._insert_products(conn, data.get('products', []))
+
+    def users_exist(self):
+        return self._connect().execute('SELECT 1 FROM users LIMIT 1').fetchone() is not None
+
+    def load_users(self):
+        return {'users': self._fetch_bodies('SELECT body FROM users ORDER BY rowid')}
+
+    def save_users(self, users_data):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM users')
+            self._insert_users(conn, users_data.get('users', []))
+
+    # ----- Sản phẩm -----
+
+    def _insert_products(self, conn, products):
+        # Upsert giữ nguyên rowid để chỉ mục tìm kiếm vẫn trỏ đúng dòng
+        conn.executemany(
+            'INSERT INTO products (id, created_by, created_at, body) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET created_by = excluded.created_by, '
+            'created_at = excluded.created_at, body = excluded.body',
+            [(p['id'], p.get('created_by'), p.get('created_at'), _dumps(p)) for p in products]
+        )
+        self._index_search(conn, products)
+
+    def get_product(self, product_id):
+        row = self._connect().execute('SELECT body FROM products WHERE id = ?', (product_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def product_exists(self, product_id):
+        return self._connect().execute('SELECT 1 FROM products WHERE id = ?', (product_id,)).fetchone() is not None
+
+    def list_products(self):
+        return self._fetch_bodies('SELECT body FROM products ORDER BY id DESC')
+
+    def _search_match(self, query):
+        terms = tokenize(query)
+        return ' '.join(f'"{term}"*' for term in terms) if terms else None
+
+    def page_products(self, before=None, limit=20, query=None):
+        """Một trang sản phẩm có id < before, mới nhất trước.
+
+        Trả về (sản phẩm, cursor trang sau hoặc None).
+        """
+        sql = 'SELECT p.body FROM products p'
+        where, params = [], []
+        if query:
+            match = self._search_match(query)
+            if not match:
+                return [], None
+            sql += ' JOIN products_fts f ON f.rowid = p.rowid'
+            where.append('products_fts MATCH ?')
+            params.append(match)
+        if before:
+            where.append('p.id < ?')
+            params.append(before)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY p.id DESC LIMIT ?'
+        params.append(limit + 1)
+
+        products = self._fetch_bodies(sql, params)
+        if len(products) > limit:
+            return products[:limit], products[limit - 1]['id']
+        return products, None
+
+    def list_products_by_owner(self, username):
+        # IS thay cho =: sản phẩm không có người tạo (created_by NULL) khớp như ở backend JSON
+        return self._fetch_bodies('SELECT body FROM products WHERE created_by IS ? ORDER BY id DESC', (username,))
+
+    def owns_product(self, username, product_id):
+        row = self._connect().execute(
+            'SELECT 1 FROM products WHERE id = ? AND created_by IS ?', (product_id, username)
+        ).fetchone()
+        return row is not None
+
+    def recent_products(self, limit):
+        return self._fetch_bodies('SELECT body FROM products ORDER BY created_at DESC LIMIT ?', (limit,))
+
+    def count_products(self):
+        return self._connect().execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
+    def add_product(self, product):
+        with self._transaction() as conn:
+            self._insert_products(conn, [product])
+
+    def update_product(self, product):
+        with self._transaction() as conn:
+            row = conn.execute('SELECT body FROM products WHERE id = ?', (product['id'],)).fetchone()
+            if not row:
+                return False
+            storage.keep_scan_fields(product, json.loads(row[0]))
+            conn.execute(
+                'UPDATE products SET created_by = ?, created_at = ?, body = ? WHERE id = ?',
+                (product.get('created_by'), product.get('created_at'), _dumps(product), product['id'])
+            )
+            self._index_search(conn, [product])
+            return True
+
+    def apply_scan_counts(self, counts):
+        """Cộng dồn lượt quét: counts = {product_id: [số lượt, lần quét cuối]}"""
+        with self._transaction() as conn:
+            for product_id, (count, last_scan) in counts.items():
+                row = conn.execute('SELECT body FROM products WHERE id = ?', (product_id,)).fetchone()
+                if not row:
+                    continue
+                product = json.loads(row[0])
+                storage.add_scan_counts(product, count, last_scan)
+                conn.execute('UPDATE products SET body = ? WHERE id = ?', (_dumps(product), product_id))
+
+    def set_media_status(self, product_id, media_path, status):
+        """Ghi trạng thái xử lý nền của một file media, trả về False nếu không có sản phẩm"""
+        with self._transaction() as conn:
+            row = conn.execute('SELECT body FROM products WHERE id = ?', (product_id,)).fetchone()
+            if not row:
+                return False
+            product = json.loads(row[0])
+            storage.apply_media_status(product, media_path, status)
+            conn.execute('UPDATE products SET body = ? WHERE id = ?', (_dumps(product), product_id))
+            return True
+
+    def append_media(self, product_id, field, media_paths, updated_at):
+        """Nối media vào sản phẩm trong transaction ghi, trả về False nếu không có sản phẩm"""
+        with self._transaction() as conn:
+            row = conn.execute('SELECT body FROM products WHERE id = ?', (product_id,)).fetchone()
+            if not row:
+                return False
+            product = json.loads(row[0])
+            storage.add_media(product, field, media_paths, updated_at)
+            conn.execute('UPDATE products SET body = ? WHERE id = ?', (_dumps(product), product_id))
+            return True
+
+    def delete_product(self, product_id):
+        """Xóa sản phẩm, trả về bản ghi đã xóa hoặc None"""
+        with self._transaction() as conn:
+            row = conn.execute('SELECT body FROM products WHERE id = ?', (product_id,)).fetchone()
+            if not row:
+                return None
+            conn.execute(
+                'DELETE FROM products_fts WHERE rowid = (SELECT rowid FROM products WHERE id = ?)', (product_id,)
+            )
+            conn.execute('DELETE FROM products WHERE id = ?', (product_id,))
+            return json.loads(row[0])
+
+    # ----- Người dùng -----
+
+    def _insert_users(self, conn, users):
+        conn.executemany(
+            'INSERT OR REPLACE INTO users (username, body) VALUES (?, ?)',
+            [(u['username'], _dumps(u)) for u in users]
+        )
+
+    def get_user(self, username):
+        row = self._connect().execute('SELECT body FROM users WHERE username = ?', (username,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list_users(self):
+        return self._fetch_bodies('SELECT body FROM users ORDER BY rowid')
+
+    def add_user(self, user):
+        with self._transaction() as conn:
+            self._insert_users(conn, [user])
+
+    def update_user(self, user):
+        with self._transaction() as conn:
+            cur = conn.execute('UPDATE users SET body = ? WHERE username = ?', (_dumps(user), user['username']))
+            return cur.rowcount > 0
+
+    def delete_user(self, username):
+        with self._transaction() as conn:
+            return conn.execute('DELETE FROM users WHERE username = ?', (username,)).rowcount > 0
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'path': self.path,
+            'pid': os.getpid(),
+            'products': self.count_products(),
+        }
+
+    # ----- Chuyển dữ liệu -----
+
+    def import_documents(self, data, users_data):
+        """Nhập dữ liệu từ data.json/users.json trong một transaction"""
+        with self._transaction() as conn:
+            self._insert_products(conn, data.get('products', []))
+            self._insert_users(conn, users_data.get('users', []))
@@ -0,0 +1,218 @@
+"""Upload chia khúc, tiếp tục được sau khi mất kết nối (cho video sản xuất/thu hoạch dung lượng lớn).
+
+Mỗi phiên upload là một thư mục trong UPLOAD_SESSIONS_DIR gồm meta.json
+(thông tin file) và data.part (các byte đã nhận). Khúc được ghi thẳng xuống
+đĩa theo từng khối nhỏ nên bộ nhớ mỗi upload không vượt quá một khối đọc,
+dù file lớn đến đâu. Vị trí tiếp tục chính là kích thước của data.part: máy
+khách hỏi trạng thái rồi gửi tiếp từ đó. Khi đủ byte, complete() tính SHA-256,
+đối chiếu với checksum máy khách gửi (nếu có) rồi đưa file vào kho media theo
+nội dung (media_store) giống upload qua form.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+import config
+import media
+import media_store
+import utils
+import video
+from storage.json_file import FileLock, write_json
+
+UPLOAD_TYPES = ('production', 'harvest')
+
+# Khối đọc/ghi khi chép khúc xuống đĩa
+COPY_BLOCK = 64 * 1024
+
+_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """Lỗi upload kèm mã HTTP để route trả về"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _session_dir(upload_id):
+    if not _ID_RE.match(upload_id or ''):
+        raise UploadError('Mã phiên upload không hợp lệ', 404)
+    return os.path.join(config.UPLOAD_SESSIONS_DIR, upload_id)
+
+
+def _read_meta(directory):
+    try:
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        raise UploadError('Không tìm thấy phiên upload', 404)
+
+
+def _lock(directory):
+    if not os.path.isdir(directory):
+        raise UploadError('Không tìm thấy phiên upload', 404)
+    return FileLock(os.path.join(directory, 'session.lock'))
+
+
+def _received(directory):
+    try:
+        return os.path.getsize(os.path.join(directory, 'data.part'))
+    except OSError:
+        return 0
+
+
+def _public(meta, received):
+    return {
+        'upload_id': meta['id'],
+        'product_id': meta['product_id'],
+        'upload_type': meta['upload_type'],
+        'filename': meta['filename'],
+        'size': meta['size'],
+        'offset': received,
+        'chunk_size': config.UPLOAD_CHUNK_SIZE,
+        'complete': received == meta['size'],
+    }
+
+
+def cleanup_expired(now=None):
+    """Xóa các phiên bỏ dở quá UPLOAD_SESSION_TTL giây không nhận thêm khúc nào"""
+    now = now or time.time()
+    removed = 0
+    try:
+        names = os.listdir(config.UPLOAD_SESSIONS_DIR)
+    except OSError:
+        return 0
+    for name in names:
+        directory = os.path.join(config.UPLOAD_SESSIONS_DIR, name)
+        try:
+            # data.part đổi mtime mỗi lần nhận khúc, thư mục thì không
+            part = os.path.join(directory, 'data.part')
+            last = os.path.getmtime(part if os.path.exists(part) else directory)
+            if now - last > config.UPLOAD_SESSION_TTL:
+                shutil.rmtree(directory)
+                removed += 1
+        except OSError as e:
+            print(f"Lỗi khi xóa phiên upload {name}: {str(e)}")
+    return removed
+
+
+def create_session(product_id, upload_type, filename, size, owner, checksum=None):
+    """Mở phiên upload mới, trả về trạng thái (gồm upload_id và chunk_size)"""
+    if upload_type not in UPLOAD_TYPES:
+        raise UploadError('Loại media không hợp lệ')
+    if not filename or not utils.allowed_file(filename):
+        raise UploadError('Định dạng file không được hỗ trợ')
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError('File rỗng hoặc kích thước không hợp lệ')
+    if size > config.MAX_FILE_SIZE:
+        raise UploadError(f'File quá lớn (tối đa {config.MAX_FILE_SIZE} bytes)', 413)
+    if checksum is not None and not re.match(r'^[0-9a-f]{64}$', checksum):
+        raise UploadError('Checksum phải là SHA-256 dạng hex')
+
+    cleanup_expired()
+
+    upload_id = uuid.uuid4().hex
+    directory = _session_dir(upload_id)
+    os.makedirs(directory)
+    open(os.path.join(directory, 'data.part'), 'wb').close()
+    meta = {
+        'id': upload_id,
+        'product_id': product_id,
+        'upload_type': upload_type,
+        'filename': filename,
+        'size': size,
+        'sha256': checksum,
+        'owner': owner,
+        'created_at': int(time.time()),
+    }
+    write_json(os.path.join(directory, 'meta.json'), meta)
+    return _public(meta, 0)
+
+
+def get_meta(upload_id):
+    """Thông tin phiên upload (để route kiểm tra quyền)"""
+    return _read_meta(_session_dir(upload_id))
+
+
+def status(upload_id):
+    """Trạng thái phiên: `offset` là số byte đã nhận, khúc kế tiếp gửi từ vị trí này"""
+    directory = _session_dir(upload_id)
+    return _public(_read_meta(directory), _received(directory))
+
+
+def write_chunk(upload_id, offset, stream, length):
+    """Ghi một khúc đọc từ `stream` (length byte) vào vị trí `offset`.
+
+    Chỉ nhận khúc nối tiếp đúng phần đã có: lệch vị trí (khúc gửi lại hoặc
+    mất khúc) trả lỗi 409 để máy khách hỏi lại trạng thái. Khúc bị đứt giữa
+    chừng được cắt bỏ, vị trí tiếp tục luôn là ranh giới khúc đã nhận đủ.
+    """
+    directory = _session_dir(upload_id)
+    if length is None:
+        raise UploadError('Thiếu Content-Length', 411)
+    if length <= 0 or length > config.UPLOAD_CHUNK_SIZE:
+        raise UploadError(f'Kích thước khúc phải từ 1 đến {config.UPLOAD_CHUNK_SIZE} bytes', 413)
+
+    with _lock(directory):
+        meta = _read_meta(directory)
+        received = _received(directory)
+        if offset != received:
+            raise UploadError(f'Vị trí khúc không khớp, server đã nhận {received} bytes', 409)
+        if received + length > meta['size']:
+            raise UploadError('Khúc vượt quá kích thước file đã khai báo', 413)
+
+        with open(os.path.join(directory, 'data.part'), 'r+b') as f:
+            f.seek(received)
+            left = length
+            try:
+                while left:
+                    block = stream.read(min(COPY_BLOCK, left))
+                    if not block:
+                        raise UploadError('Khúc bị ngắt giữa chừng', 400)
+                    f.write(block)
+                    left -= len(block)
+            except BaseException:
+                f.truncate(received)
+                raise
+        return _public(meta, received + length)
+
+
+def complete(upload_id):
+    """Ghép xong: kiểm tra đủ byte và checksum, đưa file vào kho media (media_store).
+
+    Trả về (meta, đường dẫn tương đối dạng uploads/blobs/...).
+    """
+    directory = _session_dir(upload_id)
+    with _lock(directory):
+        meta = _read_meta(directory)
+        part = os.path.join(directory, 'data.part')
+        received = _received(directory)
+        if received != meta['size']:
+            raise UploadError(f'Chưa nhận đủ file ({received}/{meta["size"]} bytes)', 409)
+
+        digest = hashlib.sha256()
+        with open(part, 'rb') as f:
+            for block in iter(lambda: f.read(COPY_BLOCK), b''):
+                digest.update(block)
+        if meta.get('sha256') and digest.hexdigest() != meta['sha256']:
+            # Dữ liệu hỏng: bỏ phần đã nhận để máy khách gửi lại từ đầu
+            open(part, 'wb').close()
+            raise UploadError('Checksum không khớp, hãy upload lại file', 422)
+
+        relative_path = media_store.store_file(part, digest.hexdigest(), meta['filename'])
+    shutil.rmtree(directory, ignore_errors=True)
+    media.submit(media.static_path(relative_path))
+    video.enqueue(meta['product_id'], relative_path)
+    meta['sha256'] = digest.hexdigest()
+    return meta, relative_path
+
+
+def abort(upload_id):
+    """Hủy phiên upload và xóa phần đã nhận"""
+    directory = _session_dir(upload_id)
+    _read_meta(directory)
+    shutil.rmtree(directory, ignore_errors=True)
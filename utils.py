@@ -2,13 +2,18 @@
 import json
 import os
 import hashlib
+import threading
 import time
-import shutil
-from werkzeug.utils import secure_filename
 from datetime import datetime
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 from flask import redirect, url_for, request, session
 import config
+import janitor
+import media
+import media_store
+import storage
+import video
 
 def init_directories():
     """Tạo các thư mục cần thiết nếu chưa tồn tại"""
@@ -17,47 +22,63 @@ def init_directories():
     os.makedirs(config.UPLOAD_DIR, exist_ok=True)
     os.makedirs(os.path.join(config.UPLOAD_DIR, 'production'), exist_ok=True)
     os.makedirs(os.path.join(config.UPLOAD_DIR, 'harvest'), exist_ok=True)
+    os.makedirs(config.UPLOAD_SESSIONS_DIR, exist_ok=True)
+    os.makedirs(config.VIDEO_QUEUE_DIR, exist_ok=True)
 
 def load_data():
-    """Đọc dữ liệu từ data.json, tạo file mới nếu chưa có"""
-    if os.path.exists(config.DATA_FILE):
+    """Đọc toàn bộ dữ liệu sản phẩm từ backend, tạo kho mới nếu chưa có"""
+    backend = storage.get_backend()
+    if backend.data_exists():
         try:
-            with open(config.DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return backend.load_data()
         except json.JSONDecodeError as e:
             print(f"Lỗi đọc file JSON: {str(e)}")
             return {}
         except Exception as e:
-            print(f"Lỗi không xác định khi đọc data.json: {str(e)}")
+            print(f"Lỗi không xác định khi đọc dữ liệu sản phẩm: {str(e)}")
             return {}
     else:
-        # Tạo file mới với cấu trúc rỗng
+        # Tạo kho mới với cấu trúc rỗng
         save_data({})
         return {}
 
+def init_data():
+    """Tạo kho mới nếu chưa có và dựng sẵn index danh sách sản phẩm.
+
+    Không giữ lại toàn bộ dữ liệu: với backend json-lazy chỉ các trường hiển
+    thị trong danh sách được nạp vào bộ nhớ.
+    """
+    backend = storage.get_backend()
+    if not backend.data_exists():
+        save_data({})
+        return
+    try:
+        backend.page_products(limit=1)
+    except Exception as e:
+        print(f"Lỗi không xác định khi đọc dữ liệu sản phẩm: {str(e)}")
+
 def save_data(data):
-    """Lưu dữ liệu vào data.json"""
+    """Ghi đè toàn bộ dữ liệu sản phẩm"""
     try:
-        with open(config.DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        storage.get_backend().save_data(data)
     except Exception as e:
-        print(f"Lỗi khi lưu data.json: {str(e)}")
+        print(f"Lỗi khi lưu dữ liệu sản phẩm: {str(e)}")
         raise
 
 def load_users():
-    """Đọc dữ liệu user từ users.json"""
-    if os.path.exists(config.USERS_FILE):
+    """Đọc toàn bộ dữ liệu user từ backend"""
+    backend = storage.get_backend()
+    if backend.users_exist():
         try:
-            with open(config.USERS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return backend.load_users()
         except json.JSONDecodeError as e:
             print(f"Lỗi đọc file users.json: {str(e)}")
             return {}
         except Exception as e:
-            print(f"Lỗi không xác định khi đọc users.json: {str(e)}")
+            print(f"Lỗi không xác định khi đọc dữ liệu user: {str(e)}")
             return {}
     else:
-        # Tạo file mới với admin user mặc định
+        # Tạo kho user mới với admin user mặc định
         default_users = {
             'users': [
                 {
@@ -73,37 +94,77 @@ def load_users():
         return default_users
 
 def save_users(users_data):
-    """Lưu dữ liệu user vào users.json"""
+    """Ghi đè toàn bộ dữ liệu user"""
     try:
-        with open(config.USERS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(users_data, f, ensure_ascii=False, indent=2)
+        storage.get_backend().save_users(users_data)
     except Exception as e:
-        print(f"Lỗi khi lưu users.json: {str(e)}")
+        print(f"Lỗi khi lưu dữ liệu user: {str(e)}")
         raise
 
-def hash_password(password):
-    """Mã hóa mật khẩu bằng bcrypt (an toàn)"""
+_bcrypt_pool = None
+_bcrypt_pool_pid = None
+_bcrypt_lock = threading.Lock()
+
+def run_bcrypt(func, *args):
+    """Chạy một hàm bcrypt trong thread pool nhỏ (BCRYPT_THREADS thread) của worker.
+
+    Thread request vẫn chờ kết quả như gọi trực tiếp; pool chỉ để giới hạn số
+    phép hash chạy cùng lúc trong một worker (mặc định 1). Một đợt đăng nhập
+    xếp hàng ở đây thay vì chiếm mọi CPU, và vì bcrypt nhả GIL nên các thread
+    gthread khác vẫn phục vụ request không cần hash.
+    """
+    global _bcrypt_pool, _bcrypt_pool_pid
+    with _bcrypt_lock:
+        if _bcrypt_pool is None or _bcrypt_pool_pid != os.getpid():
+            # Thread không đi theo qua fork, mỗi worker tạo pool riêng
+            _bcrypt_pool = ThreadPoolExecutor(max_workers=config.BCRYPT_THREADS, thread_name_prefix='bcrypt')
+            _bcrypt_pool_pid = os.getpid()
+    return _bcrypt_pool.submit(func, *args).result()
+
+def hash_password(password, rounds=None):
+    """Mã hóa mật khẩu bằng bcrypt (an toàn) với BCRYPT_ROUNDS vòng"""
     import bcrypt
     # Tạo salt và hash password
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
+    salt = bcrypt.gensalt(rounds or config.BCRYPT_ROUNDS)
+    hashed = run_bcrypt(bcrypt.hashpw, password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
 def verify_password(password, hashed):
     """Xác thực mật khẩu"""
     import bcrypt
     try:
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+        return run_bcrypt(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
     except:
         # Fallback cho mật khẩu cũ dùng MD5 (migration)
         old_hash = hashlib.md5(password.encode()).hexdigest()
         return old_hash == hashed
 
+def needs_rehash(hashed):
+    """Hash cần tạo lại: MD5 cũ hoặc bcrypt có số vòng khác BCRYPT_ROUNDS"""
+    parts = hashed.split('$')
+    if len(parts) < 4 or not parts[1].startswith('2'):
+        return True
+    try:
+        return int(parts[2]) != config.BCRYPT_ROUNDS
+    except ValueError:
+        return True
+
+def get_page_args(args):
+    """Đọc tham số phân trang keyset (before, limit) từ query string"""
+    before = args.get('before', '').strip() or None
+    try:
+        limit = int(args.get('limit', config.PAGE_SIZE))
+    except ValueError:
+        limit = config.PAGE_SIZE
+    return before, max(1, min(limit, config.MAX_PAGE_SIZE))
+
 def login_required(f):
     """Decorator để yêu cầu đăng nhập"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user' not in session:
+        # Trang cần đăng nhập luôn đối chiếu với kho user (một lần tra cache):
+        # user đã bị xóa thì session bị xóa và phải đăng nhập lại ngay
+        if 'user' not in session or get_user_info(session, verify=True) is None:
             return redirect(url_for('auth.login', next=request.url))
         return f(*args, **kwargs)
     return decorated_function
@@ -122,109 +183,113 @@ def is_video_file(filename):
     video_extensions = {'mp4', 'mov', 'avi', 'mkv', 'webm'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in video_extensions
 
+_upload_pool = None
+_upload_pool_pid = None
+
+def _save_file(file, product_id):
+    """Lưu một file vào kho media, trả về đường dẫn tương đối (chạy trong thread pool)"""
+    # Băm và kiểm tra kích thước trong lúc ghi, lưu theo nội dung
+    relative_path, _ = media_store.store_stream(file.stream, file.filename, config.MAX_FILE_SIZE)
+    # Tạo ảnh thu nhỏ / xếp hàng xử lý video ở nền, không bắt request chờ
+    media.submit(media.static_path(relative_path))
+    video.enqueue(product_id, relative_path)
+    return relative_path
+
 def save_uploaded_files(files, product_id, upload_type):
-    """Lưu các file đã upload và trả về danh sách đường dẫn"""
-    saved_files = []
+    """Lưu các file đã upload vào kho media (media_store) và trả về danh sách đường dẫn.
+
+    File trùng nội dung với file đã có (kể cả của sản phẩm khác) không được
+    lưu thêm, chỉ tăng số tham chiếu. Các file được ghi song song trong thread
+    pool (UPLOAD_THREADS) nên thời gian chờ theo file lớn nhất chứ không theo
+    tổng; kết quả giữ đúng thứ tự file đã chọn, file lỗi bị bỏ qua.
+    """
+    global _upload_pool, _upload_pool_pid
+    files = [f for f in files or [] if f and f.filename and allowed_file(f.filename)]
     if not files:
-        return saved_files
-
-    upload_folder = os.path.join(config.UPLOAD_DIR, upload_type, product_id)
-    os.makedirs(upload_folder, exist_ok=True)
-
-    for file in files:
-        if file and file.filename and allowed_file(file.filename):
-            # Kiểm tra kích thước file
-            file.seek(0, os.SEEK_END)
-            file_size = file.tell()
-            file.seek(0)  # Reset về đầu file
-
-            if file_size > config.MAX_FILE_SIZE:
-                print(f"File {file.filename} quá lớn ({file_size} bytes, tối đa {config.MAX_FILE_SIZE} bytes)")
-                continue
-
-            if file_size == 0:
-                print(f"File {file.filename} rỗng")
-                continue
-
-            # Tạo tên file an toàn
-            filename = secure_filename(file.filename)
-            # Thêm timestamp để tránh trùng tên
-            timestamp = str(int(time.time() * 1000))
-            name, ext = os.path.splitext(filename)
-            new_filename = f"{name}_{timestamp}{ext}"
-            file_path = os.path.join(upload_folder, new_filename)
-
-            try:
-                file.save(file_path)
-                # Lưu đường dẫn tương đối để hiển thị
-                relative_path = f"uploads/{upload_type}/{product_id}/{new_filename}"
-                saved_files.append(relative_path)
-            except Exception as e:
-                print(f"Lỗi khi lưu file {filename}: {str(e)}")
-                continue
+        return []
 
-    return saved_files
+    if len(files) == 1:
+        jobs = [(files[0], None)]
+    else:
+        if _upload_pool is None or _upload_pool_pid != os.getpid():
+            # Thread không đi theo qua fork, mỗi worker tạo pool riêng
+            _upload_pool = ThreadPoolExecutor(max_workers=config.UPLOAD_THREADS, thread_name_prefix='upload')
+            _upload_pool_pid = os.getpid()
+        jobs = [(file, _upload_pool.submit(_save_file, file, product_id)) for file in files]
 
-def generate_qrcode(product_id, base_url):
-    """Tạo mã QR cho sản phẩm"""
-    import qrcode
-
-    # URL của trang sản phẩm (loại bỏ dấu / cuối nếu có)
-    base = base_url.rstrip('/')
-    url = f"{base}/product/{product_id}"
-
-    # Tạo QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-
-    # Tạo hình ảnh QR
-    img = qr.make_image(fill_color="black", back_color="white")
-
-    # Lưu vào thư mục static/qrcodes
-    qr_path = os.path.join(config.QRCODE_DIR, f'{product_id}.png')
-    img.save(qr_path)
-
-    return qr_path
-
-def delete_product_files(product_id):
-    """Xóa tất cả file liên quan đến sản phẩm (QR code và media)"""
-    # Xóa file QR code
-    qr_path = os.path.join(config.QRCODE_DIR, f'{product_id}.png')
-    if os.path.exists(qr_path):
+    saved_files = []
+    for file, future in jobs:
         try:
-            os.remove(qr_path)
-        except:
-            pass
-
-    # Xóa thư mục media của sản phẩm
-    production_media_dir = os.path.join(config.UPLOAD_DIR, 'production', product_id)
-    harvest_media_dir = os.path.join(config.UPLOAD_DIR, 'harvest', product_id)
-
-    for media_dir in [production_media_dir, harvest_media_dir]:
-        if os.path.exists(media_dir):
-            try:
-                shutil.rmtree(media_dir)
-            except:
-                pass
-
-def get_user_info(session):
-    """Lấy thông tin user từ session"""
+            relative_path = future.result() if future else _save_file(file, product_id)
+            # Lưu đường dẫn tương đối để hiển thị
+            saved_files.append(relative_path)
+        except Exception as e:
+            print(f"Lỗi khi lưu file {file.filename}: {str(e)}")
+
+    return saved_files
+
+def delete_product_files(product_id, product=None):
+    """Xóa tất cả file liên quan đến sản phẩm (QR code và media).
+
+    `product` là bản ghi vừa xóa: blob nó tham chiếu được giảm tham chiếu ngay
+    (chỉ bị xóa khi không còn sản phẩm nào khác dùng). QR cũ và thư mục media
+    riêng được xóa trong thread janitor nên request không phải chờ xóa thư mục
+    video lớn.
+    """
+    janitor.submit_product_deletion(product_id, product)
+
+def _user_snapshot(user):
+    return {
+        'full_name': user.get('full_name', user['username']),
+        'role': user.get('role', 'user'),
+        'version': user.get('version', 0),
+        'checked_at': int(time.time())
+    }
+
+def set_session_user(session, user):
+    """Lưu user đăng nhập cùng ảnh chụp role/full_name/version vào session.
+
+    Session của Flask là cookie đã ký bằng SECRET_KEY nên người dùng không
+    sửa được ảnh chụp.
+    """
+    session['user'] = user['username']
+    session['user_name'] = user.get('full_name', user['username'])
+    session['user_snapshot'] = _user_snapshot(user)
+
+def bump_user_version(user):
+    """Tăng version của bản ghi user để session cũ đọc lại role/full_name"""
+    user['version'] = user.get('version', 0) + 1
+
+def get_user_info(session, verify=False):
+    """Lấy thông tin user từ session.
+
+    Dùng ảnh chụp trong session, chỉ đối chiếu với kho user sau mỗi
+    USER_SNAPSHOT_TTL giây (hoặc luôn đối chiếu nếu `verify`, dùng cho trang
+    cần đăng nhập và trang admin); nếu ảnh chụp đã cũ (sửa hồ sơ, admin sửa user) thì được đọc lại.
+    User đã bị xóa thì session bị xóa theo và trả về None.
+    """
     if 'user' not in session:
         return None
 
-    users_data = load_users()
-    for user in users_data.get('users', []):
-        if user.get('username') == session.get('user'):
-            return {
-                'username': user.get('username'),
-                'full_name': user.get('full_name', user.get('username')),
-                'role': user.get('role', 'user')
-            }
-    return None
+    snapshot = session.get('user_snapshot')
+    now = int(time.time())
+    if verify or not snapshot or now - snapshot.get('checked_at', 0) >= config.USER_SNAPSHOT_TTL:
+        user = storage.get_backend().get_user(session.get('user'))
+        if not user:
+            session.clear()
+            return None
+        fresh = _user_snapshot(user)
+        # So cả role/full_name: user bị xóa rồi tạo lại cùng tên có version bắt đầu lại từ 0
+        if snapshot and all(snapshot.get(k) == fresh[k] for k in ('version', 'role', 'full_name')):
+            if now - snapshot.get('checked_at', 0) >= config.USER_SNAPSHOT_TTL:
+                snapshot['checked_at'] = now
+                session.modified = True
+        else:
+            set_session_user(session, user)
+        snapshot = session['user_snapshot']
 
+    return {
+        'username': session.get('user'),
+        'full_name': snapshot.get('full_name'),
+        'role': snapshot.get('role', 'user')
+    }
@@ -0,0 +1,315 @@
+"""Hàng đợi xử lý video nền: ảnh poster và bản MP4 phát trực tuyến được (cần ffmpeg).
+
+Video .mov/.avi/.mkv quay từ điện thoại nhiều trình duyệt không phát được và
+thường rất nặng. Mỗi video upload lên được xếp một job vào VIDEO_QUEUE_DIR
+(một file .job, dùng chung giữa các worker gunicorn và lệnh process-videos);
+thread xử lý nhận job bằng cách đổi tên .job thành .run (os.rename là nguyên
+tử nên mỗi job chỉ một thread nhận), chạy ffmpeg rồi ghi kết quả vào _derived/
+cạnh file gốc, với kho media theo nội dung là thư mục của blob:
+
+    static/uploads/blobs/<ab>/_derived/<sha256><đuôi>.poster.jpg
+    static/uploads/blobs/<ab>/_derived/<sha256><đuôi>.web.mp4
+
+Kết quả dùng chung cho mọi sản phẩm có cùng video (đã có thì không chạy lại
+ffmpeg) và chỉ bị xóa cùng blob khi hết tham chiếu (media_store, janitor).
+
+Trạng thái (processing, ready, failed; chưa có nghĩa là đang chờ) được ghi
+vào product['media_status'][<đường dẫn media>] qua backend.set_media_status().
+Trang sản phẩm phát bản web khi đã sẵn sàng, chưa xong thì phát file gốc.
+"""
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from functools import lru_cache
+import config
+import media
+import media_store
+import storage
+from storage.json_file import write_json
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm')
+MIMETYPES = {'.mp4': 'video/mp4', '.mov': 'video/quicktime', '.webm': 'video/webm',
+             '.mkv': 'video/x-matroska', '.avi': 'video/x-msvideo'}
+
+# Job bị bỏ dở (worker chết giữa chừng) được xếp lại tối đa bấy nhiêu lần
+MAX_ATTEMPTS = 3
+POLL_INTERVAL = 5
+
+_wakeup = threading.Event()
+_lock = threading.Lock()
+_workers_pid = None
+_next_requeue = 0
+
+
+def is_video(path):
+    return path.lower().endswith(VIDEO_EXTENSIONS)
+
+
+@lru_cache(maxsize=1)
+def available():
+    """ffmpeg có được cài không"""
+    return shutil.which(config.FFMPEG_BIN) is not None
+
+
+@lru_cache(maxsize=1)
+def _nice_bin():
+    return shutil.which('nice')
+
+
+def _now():
+    return time.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _outputs(media_path):
+    """Đường dẫn tương đối (trong static/) của ảnh poster và bản web"""
+    directory, name = os.path.split(media_path)
+    prefix = f'{directory}/{media.DERIVED_DIR}/{name}'
+    return prefix + '.poster.jpg', prefix + '.web.mp4'
+
+
+# ----- Hàng đợi -----
+
+def enqueue(product_id, media_path):
+    """Xếp hàng xử lý một video vừa lưu (không chờ); bỏ qua nếu không phải video hoặc không có ffmpeg.
+
+    Không ghi trạng thái vào bản ghi ở đây vì khi tạo sản phẩm, file được lưu
+    trước khi bản ghi tồn tại; chưa có trạng thái nghĩa là đang chờ xử lý.
+    """
+    if not is_video(media_path) or not available():
+        return False
+    job = {'product_id': product_id, 'media_path': media_path, 'attempts': 0, 'queued_at': _now()}
+    name = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}.job'
+    os.makedirs(config.VIDEO_QUEUE_DIR, exist_ok=True)
+    write_json(os.path.join(config.VIDEO_QUEUE_DIR, name), job)
+    _wakeup.set()
+    return True
+
+
+def _claim():
+    """Nhận job cũ nhất còn chờ, trả về (đường dẫn file .run, job) hoặc None"""
+    try:
+        names = sorted(n for n in os.listdir(config.VIDEO_QUEUE_DIR) if n.endswith('.job'))
+    except OSError:
+        return None
+    for name in names:
+        path = os.path.join(config.VIDEO_QUEUE_DIR, name)
+        running = path[:-4] + '.run'
+        try:
+            os.rename(path, running)
+        except OSError:
+            continue  # Thread/worker khác đã nhận
+        try:
+            # rename giữ mtime lúc xếp hàng; requeue_stale tính thời gian chạy từ mtime của .run
+            os.utime(running)
+            with open(running, 'r', encoding='utf-8') as f:
+                return running, json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Lỗi khi đọc job video {name}: {str(e)}")
+            _remove(running)
+    return None
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def requeue_stale(now=None):
+    """Xếp lại các job .run quá VIDEO_JOB_TIMEOUT giây (worker xử lý đã chết), trả về số job"""
+    now = now or time.time()
+    count = 0
+    try:
+        names = [n for n in os.listdir(config.VIDEO_QUEUE_DIR) if n.endswith('.run')]
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(config.VIDEO_QUEUE_DIR, name)
+        try:
+            if now - os.path.getmtime(path) <= config.VIDEO_JOB_TIMEOUT:
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            continue
+        job['attempts'] = job.get('attempts', 0) + 1
+        if job['attempts'] >= MAX_ATTEMPTS:
+            _set_status(job, {'state': 'failed', 'error': 'Xử lý quá thời gian cho phép', 'updated_at': _now()})
+            _remove(path)
+            continue
+        write_json(path[:-4] + '.job', job)
+        _remove(path)
+        count += 1
+    return count
+
+
+def requeue_stale_if_due():
+    """Gọi requeue_stale() tối đa một lần mỗi VIDEO_JOB_TIMEOUT giây trong tiến trình này.
+
+    Thread xử lý gọi khi rảnh để job của worker/thread đã chết không nằm mãi ở
+    trạng thái .run cho tới khi có tiến trình khởi động lại.
+    """
+    global _next_requeue
+    with _lock:
+        if time.monotonic() < _next_requeue:
+            return 0
+        _next_requeue = time.monotonic() + config.VIDEO_JOB_TIMEOUT
+    return requeue_stale()
+
+
+def pending_count():
+    """Số job đang chờ và đang chạy"""
+    try:
+        names = os.listdir(config.VIDEO_QUEUE_DIR)
+    except OSError:
+        return {'queued': 0, 'running': 0}
+    return {'queued': sum(n.endswith('.job') for n in names), 'running': sum(n.endswith('.run') for n in names)}
+
+
+# ----- Xử lý -----
+
+def _set_status(job, status, wait=0):
+    """Ghi trạng thái vào bản ghi; chờ tối đa `wait` giây nếu bản ghi chưa được tạo xong"""
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            if storage.get_backend().set_media_status(job['product_id'], job['media_path'], status):
+                return True
+        except Exception as e:
+            print(f"Lỗi khi ghi trạng thái video {job['media_path']}: {str(e)}")
+            return False
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(1)
+
+
+def _ffmpeg(args):
+    """Chạy ffmpeg với độ ưu tiên thấp để không tranh CPU với request web"""
+    command = [config.FFMPEG_BIN, '-nostdin', '-hide_banner', '-loglevel', 'error', '-y'] + args
+    # Dùng lệnh nice thay cho preexec_fn (không an toàn khi tiến trình có nhiều thread)
+    if _nice_bin():
+        command = [_nice_bin(), '-n', '10'] + command
+    result = subprocess.run(command, capture_output=True, timeout=config.VIDEO_JOB_TIMEOUT)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode('utf-8', 'replace').strip()[-500:] or 'ffmpeg lỗi')
+
+
+def transcode(source, poster_path, web_path):
+    """Tạo ảnh poster (JPEG) và bản MP4 H.264/AAC faststart, giới hạn chiều cao và bitrate"""
+    os.makedirs(os.path.dirname(poster_path), exist_ok=True)
+    # Ghi ra file tạm rồi đổi tên để trang web không bao giờ trỏ tới file đang ghi dở
+    poster_tmp, web_tmp = poster_path + '.tmp.jpg', web_path + '.tmp.mp4'
+    try:
+        # Bộ lọc thumbnail chọn khung hình tiêu biểu trong vài giây đầu (tránh khung đen)
+        _ffmpeg(['-i', source, '-vf', f"thumbnail=60,scale=-2:'min({config.VIDEO_MAX_HEIGHT},ih)'",
+                 '-frames:v', '1', '-q:v', '4', poster_tmp])
+        _ffmpeg(['-i', source, '-map', '0:v:0', '-map', '0:a:0?',
+                 '-vf', f"scale=-2:'min({config.VIDEO_MAX_HEIGHT},ih)',format=yuv420p",
+                 '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '26', '-profile:v', 'main',
+                 '-maxrate', f'{config.VIDEO_MAX_BITRATE}k', '-bufsize', f'{config.VIDEO_MAX_BITRATE * 2}k',
+                 '-c:a', 'aac', '-b:a', '96k', '-ac', '2',
+                 '-movflags', '+faststart', '-threads', str(config.VIDEO_FFMPEG_THREADS), web_tmp])
+        os.replace(poster_tmp, poster_path)
+        os.replace(web_tmp, web_path)
+    finally:
+        _remove(poster_tmp)
+        _remove(web_tmp)
+
+
+def process(job):
+    """Xử lý một job: đánh dấu processing, chạy ffmpeg, ghi ready/failed"""
+    media_path = job['media_path']
+    source = media.static_path(media_path)
+    poster, web = _outputs(media_path)
+    started = time.monotonic()
+    _set_status(job, {'state': 'processing', 'updated_at': _now()})
+    try:
+        if not os.path.exists(source):
+            raise RuntimeError('File gốc không còn')
+        # Cùng nội dung đã được xử lý cho sản phẩm khác (kho media theo nội dung)
+        if not (os.path.exists(media.static_path(poster)) and os.path.exists(media.static_path(web))):
+            transcode(source, media.static_path(poster), media.static_path(web))
+    except Exception as e:
+        print(f"Lỗi khi xử lý video {media_path}: {str(e)}")
+        _set_status(job, {'state': 'failed', 'error': str(e)[:500], 'updated_at': _now()}, wait=30)
+        return False
+
+    status = {
+        'state': 'ready',
+        'poster': poster,
+        'web': web,
+        'web_size': os.path.getsize(media.static_path(web)),
+        'seconds': round(time.monotonic() - started, 1),
+        'updated_at': _now(),
+    }
+    # Video ngắn có thể xong trước khi create() kịp lưu bản ghi sản phẩm
+    if not _set_status(job, status, wait=30):
+        # Sản phẩm đã bị xóa: bỏ kết quả (blob dùng chung do media_store tự dọn khi hết tham chiếu)
+        if not media_store.is_blob(media_path):
+            _remove(media.static_path(poster))
+            _remove(media.static_path(web))
+        return False
+    return True
+
+
+def run_once():
+    """Nhận và xử lý một job, trả về False nếu hàng đợi trống"""
+    claimed = _claim()
+    if claimed is None:
+        return False
+    path, job = claimed
+    try:
+        process(job)
+    finally:
+        _remove(path)
+    return True
+
+
+def _worker():
+    while True:
+        try:
+            if run_once():
+                continue
+        except Exception as e:
+            print(f"Lỗi trong thread xử lý video: {str(e)}")
+        if not _wakeup.wait(POLL_INTERVAL):
+            try:
+                requeue_stale_if_due()
+            except Exception as e:
+                print(f"Lỗi khi xếp lại job video bị bỏ dở: {str(e)}")
+        _wakeup.clear()
+
+
+def start_workers():
+    """Khởi động VIDEO_WORKERS thread xử lý trong tiến trình này (mỗi tiến trình một lần)"""
+    global _workers_pid
+    if config.VIDEO_WORKERS <= 0 or _workers_pid == os.getpid():
+        return
+    with _lock:
+        if _workers_pid == os.getpid():
+            return
+        _workers_pid = os.getpid()
+    requeue_stale_if_due()
+    for i in range(config.VIDEO_WORKERS):
+        threading.Thread(target=_worker, name=f'video-worker-{i}', daemon=True).start()
+
+
+# ----- Template -----
+
+def video_sources(product, media_path):
+    """Nguồn phát cho template: {'src', 'type', 'poster', 'state'}.
+
+    Bản web (MP4) khi đã xử lý xong, ngược lại là file gốc với đúng kiểu MIME.
+    """
+    status = (product.get(storage.MEDIA_STATUS_FIELD) or {}).get(media_path) or {}
+    if status.get('state') == 'ready':
+        return {'src': media.media_url(status['web']), 'type': 'video/mp4',
+                'poster': media.media_url(status['poster']), 'state': 'ready'}
+    ext = os.path.splitext(media_path)[1].lower()
+    return {'src': media.media_url(media_path), 'type': MIMETYPES.get(ext, 'video/mp4'),
+            'poster': '', 'state': status.get('state', 'queued' if available() else '')}